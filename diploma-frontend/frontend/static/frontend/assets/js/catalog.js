@@ -52,7 +52,7 @@ var mix = {
             if (max !== 50000) {
                 this.filter.maxPrice = max
             }
-            this.getData("/api/catalog", {
+            const params = {
                 filter: {
                     ...this.filter,
                     minPrice: min,
@@ -64,11 +64,18 @@ var mix = {
                 sortType: this.selectedSort ? this.selectedSort.selected : null,
                 tags,
                 limit: PAGE_LIMIT
-            })
+            }
+            // следующая страница - по курсору, остальные - по номеру
+            if (this.nextCursor && page === this.currentPage + 1) {
+                params.cursor = this.nextCursor
+            }
+            this.nextCursor = null
+            this.getData("/api/catalog", params)
                 .then(data => {
                     this.catalogCards = data.items
                     this.currentPage = data.currentPage
                     this.lastPage = data.lastPage
+                    this.nextCursor = data.nextCursor
 
                 }).catch(() => {
                     console.warn('Ошибка при получении каталога')
@@ -94,6 +101,7 @@ var mix = {
             catalogCards: [],
             currentPage: null,
             lastPage: 1,
+            nextCursor: null,
             selectedSort: null,
             filter: {
                 name: '',
@@ -32,8 +32,10 @@ var mix = {
                 email: this.review.email,
                 text: this.review.text,
                 rate: this.review.rate
-            }).then(({data}) => {
-                this.product.reviews = data
+            }).then(() => {
+                this.product.reviewsCount = (this.product.reviewsCount || 0) + 1
+                this.reviewsCursor = null
+                this.loadReviews()
                 alert('Отзыв опубликован')
                 this.review.author = ''
                 this.review.email = ''
@@ -43,6 +45,19 @@ var mix = {
                 console.warn('Ошибка при публикации отзыва')
             })
         },
+        loadReviews () {
+            // в товаре только последние отзывы, остальные - страницами по курсору
+            const params = { limit: 10 }
+            if (this.reviewsCursor) params.cursor = this.reviewsCursor
+            this.getData(`/api/product/${this.product.id}/reviews`, params).then(data => {
+                this.product.reviews = this.reviewsCursor
+                    ? [...this.product.reviews, ...data.items]
+                    : data.items
+                this.reviewsCursor = data.nextCursor
+            }).catch(() => {
+                console.warn('Ошибка при получении отзывов')
+            })
+        },
         setActivePhoto(index) {
             this.activePhoto = index
         }
@@ -54,6 +69,7 @@ var mix = {
         return {
             product : {},
             activePhoto: 0,
+            reviewsCursor: null,
             count: 1,
             review: {
                 author: '',
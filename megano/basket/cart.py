@@ -1,30 +1,277 @@
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
 
 from product.models import Product
+from .models import CartItem
 
 
-class Cart(object):
-    """Объект корзины в сессии"""
+class SessionCartStorage:
+    """
+    Корзина в сессии: {id товара: {"quantity": ...}}. Чтение пустой корзины
+    сессию не меняет, поэтому для гостей без покупок она не сохраняется в БД
+    """
 
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
+
+    def quantities(self):
+        return {product_id: item["quantity"] for product_id, item in self.cart.items()}
+
+    def add(self, product_id, quantity, override_quantity=False):
+        item = self.cart.setdefault(product_id, {"quantity": 0})
+        if override_quantity:
+            item["quantity"] = quantity
+        else:
+            item["quantity"] += quantity
+        self.save()
+
+    def remove(self, product_id, quantity):
+        if product_id in self.cart:
+            if quantity >= self.cart[product_id]["quantity"]:
+                del self.cart[product_id]
+            else:
+                self.cart[product_id]["quantity"] -= quantity
+            self.save()
+
+    def update(self, quantities):
+        for product_id, quantity in quantities.items():
+            if quantity:
+                self.cart[product_id] = {"quantity": quantity}
+            else:
+                self.cart.pop(product_id, None)
+        self.save()
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+    def save(self):
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self.session.modified = True
+
+
+CART_COOKIE_SALT = "basket.cart"
+
+
+def get_http_request(request):
+    # DRF Request не передаёт присвоенные атрибуты в HttpRequest middleware
+    return getattr(request, "_request", request)
+
+
+def decode_cart_cookie(value):
+    """Компактная запись "id:количество,id:количество" -> {id: количество}"""
+    cart = {}
+    for line in filter(None, (value or "").split(",")):
+        product_id, _, quantity = line.partition(":")
+        if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            cart[product_id] = int(quantity)
+    return cart
+
+
+def encode_cart_cookie(cart):
+    return ",".join(f"{product_id}:{quantity}" for product_id, quantity in cart.items())
+
+
+class SignedCookieCartStorage:
+    """
+    Корзина гостя в подписанной cookie: только id товаров и количества.
+    Изменения записываются в ответ CartCookieMiddleware, сессия не нужна.
+    """
+
+    def __init__(self, request):
+        self.request = get_http_request(request)
+        if not hasattr(self.request, "cart_cookie"):
+            value = self.request.get_signed_cookie(
+                settings.CART_COOKIE_NAME, default=None, salt=CART_COOKIE_SALT
+            )
+            self.request.cart_cookie = decode_cart_cookie(value)
+        self.cart = self.request.cart_cookie
+
+    def quantities(self):
+        return dict(self.cart)
+
+    def add(self, product_id, quantity, override_quantity=False):
+        if override_quantity:
+            self.cart[product_id] = quantity
+        else:
+            self.cart[product_id] = self.cart.get(product_id, 0) + quantity
+        self.save()
+
+    def remove(self, product_id, quantity):
+        if product_id in self.cart:
+            if quantity >= self.cart[product_id]:
+                del self.cart[product_id]
+            else:
+                self.cart[product_id] -= quantity
+            self.save()
+
+    def update(self, quantities):
+        for product_id, quantity in quantities.items():
+            if quantity:
+                self.cart[product_id] = quantity
+            else:
+                self.cart.pop(product_id, None)
+        self.save()
+
+    def clear(self):
+        if self.cart:
+            self.cart.clear()
+            self.save()
+
+    def save(self):
+        self.request.cart_cookie_changed = True
+
+
+class DatabaseCartStorage:
+    """
+    Корзина авторизованного пользователя в таблице CartItem: изменение
+    строки - запись одной строки, без перезаписи всей сессии
+    """
+
+    def __init__(self, user):
+        self.items = CartItem.objects.filter(user=user)
+        self.user = user
+
+    def quantities(self):
+        return {
+            str(product_id): quantity
+            for product_id, quantity in self.items.values_list("product", "quantity")
+        }
+
+    def add(self, product_id, quantity, override_quantity=False):
+        item = self.items.filter(product_id=product_id)
+        value = quantity if override_quantity else F("quantity") + quantity
+        if item.update(quantity=value):
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(
+                    user=self.user, product_id=product_id, quantity=quantity
+                )
+        except IntegrityError:
+            # строку успел создать параллельный запрос
+            item.update(quantity=value)
+
+    def remove(self, product_id, quantity):
+        item = self.items.filter(product_id=product_id)
+        if not item.filter(quantity__gt=quantity).update(
+            quantity=F("quantity") - quantity
+        ):
+            item.delete()
+
+    def update(self, quantities):
+        """Новые количества: удаление нулевых строк и один upsert остальных"""
+        removed = [
+            product_id for product_id, quantity in quantities.items() if not quantity
+        ]
+        if removed:
+            self.items.filter(product_id__in=removed).delete()
+        CartItem.objects.bulk_create(
+            [
+                CartItem(user=self.user, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items()
+                if quantity
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity"],
+        )
+
+    def clear(self):
+        self.items.delete()
+
+
+CART_OPERATIONS = ("add", "remove", "set")
+
+
+def apply_operations(quantities, operations):
+    """
+    Применяет операции {"id", "count", "op"} к количествам {id: количество}
+    в памяти и возвращает только изменённые строки (0 - строку удалить)
+    """
+    current, changed = dict(quantities), {}
+    for operation in operations:
+        product_id, count = str(operation["id"]), operation["count"]
+        quantity = current.get(product_id, 0)
+        if operation["op"] == "add":
+            quantity += count
+        elif operation["op"] == "remove":
+            quantity = max(quantity - count, 0)
+        else:
+            quantity = count
+        current[product_id] = changed[product_id] = quantity
+    return {
+        product_id: quantity
+        for product_id, quantity in changed.items()
+        if quantity != quantities.get(product_id, 0)
+    }
+
+
+def get_guest_cart_storage(request):
+    if settings.CART_STORAGE == "cookie":
+        return SignedCookieCartStorage(request)
+    return SessionCartStorage(request)
+
+
+def get_cart_storage(request):
+    if request.user.is_authenticated:
+        return DatabaseCartStorage(request.user)
+    return get_guest_cart_storage(request)
+
+
+def merge_guest_cart(request, user):
+    """При входе корзина гостя переносится в корзину пользователя"""
+    guest_cart = get_guest_cart_storage(request)
+    quantities = guest_cart.quantities()
+    if not quantities:
+        return
+    storage = DatabaseCartStorage(user)
+    existing = set(
+        Product.objects.filter(pk__in=quantities).values_list("pk", flat=True)
+    )
+    with transaction.atomic():
+        for product_id, quantity in quantities.items():
+            if int(product_id) in existing:
+                storage.add(product_id, quantity)
+    guest_cart.clear()
+
+
+class Cart(object):
+    """Корзина: в сессии для гостей, в CartItem для авторизованных"""
+
+    def __init__(self, request):
+        self.storage = get_cart_storage(request)
+
+    @property
+    def cart(self):
+        return {
+            product_id: {"quantity": quantity}
+            for product_id, quantity in self.storage.quantities().items()
+        }
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
+        return self.items(Product.objects.all())
+
+    def items(self, products):
+        """
+        Строки корзины вместе с товарами: все товары загружаются одним
+        запросом из products (с нужными select/prefetch_related) и
+        отдаются в item["product"]. Цена - текущая, с учётом распродаж.
+        Удалённые товары пропускаются.
+        """
+        quantities = self.storage.quantities()
+        products = products.filter(id__in=quantities).with_effective_price()
+        cart = {}
 
         for product in products:
             product_id = str(product.id)
-            cart[product_id]["product_id"] = product_id
-            cart[product_id]["price"] = float(product.price)
-            cart[product_id]["total_price"] = (
-                cart[product_id]["price"] * cart[product_id]["quantity"]
-            )
+            item = cart[product_id] = {"quantity": quantities[product_id]}
+            item["product_id"] = product_id
+            item["product"] = product
+            item["price"] = float(product.effective_price)
+            item["total_price"] = item["price"] * item["quantity"]
 
         sorted_cart = sorted(cart.values(), key=lambda item: item["product_id"])
 
@@ -32,36 +279,24 @@ class Cart(object):
             yield item
 
     def __len__(self):
-        return sum(item["quantity"] for item in self.cart.values())
+        return sum(self.storage.quantities().values())
 
     def add(self, product, quantity=1, override_quantity=False):
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {"quantity": 0, "price": float(product.price)}
-        if override_quantity:
-            self.cart[product_id]["quantity"] = quantity
-        else:
-            self.cart[product_id]["quantity"] += quantity
-        self.save()
+        self.storage.add(str(product.id), int(quantity), override_quantity)
 
     def remove(self, product, quantity=1):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            if quantity >= self.cart[product_id]["quantity"]:
-                del self.cart[product_id]
-            else:
-                self.cart[product_id]["quantity"] -= quantity
-            self.save()
+        self.storage.remove(str(product.id), int(quantity))
 
     def get_total_price(self):
-        return sum(
-            float(item["price"]) * item["quantity"] for item in self.cart.values()
-        )
+        # по текущим ценам товаров, а не по ценам на момент добавления
+        return sum(item["total_price"] for item in self)
 
-    def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
+    def apply(self, operations):
+        """Несколько операций с одной записью в хранилище корзины"""
+        with transaction.atomic():
+            changed = apply_operations(self.storage.quantities(), operations)
+            if changed:
+                self.storage.update(changed)
 
-    def save(self):
-        self.session[settings.CART_SESSION_ID] = self.cart
-        self.session.modified = True
+    def clear(self):
+        self.storage.clear()
@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from product.models import Product
+
+MODES = {
+    "db": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "CART_STORAGE": "session",
+    },
+    "cache": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.cache",
+        "CART_STORAGE": "session",
+    },
+    "cookie": {
+        "SESSION_ENGINE": "basket.sessions",
+        "CART_STORAGE": "cookie",
+    },
+    # авторизованный пользователь: сессия в кэше, корзина в CartItem
+    "user": {
+        "SESSION_ENGINE": "basket.sessions",
+        "CART_STORAGE": "cookie",
+    },
+}
+LOGGED_IN_MODES = {"user"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает запросы в секунду к /api/basket для корзины гостя в сессии "
+        "в БД, в сессии в кэше и в подписанной cookie, а также для корзины "
+        "авторизованного пользователя в БД с сессией в кэше: чтение корзины и "
+        "изменение (добавление и удаление товара), плюс число запросов к "
+        "django_session на один HTTP-запрос."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--mode", choices=MODES, action="append")
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by("pk").first()
+        if product is None:
+            raise CommandError("No products to put in the cart")
+        self.stdout.write(
+            f"{'mode':<8}{'read rps':>10}{'write rps':>11}{'session queries':>17}"
+        )
+        for mode in options["mode"] or MODES:
+            hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+            with override_settings(ALLOWED_HOSTS=hosts, **MODES[mode]):
+                result = self.measure(
+                    product, options["requests"], mode in LOGGED_IN_MODES
+                )
+            self.stdout.write(
+                f"{mode:<8}{result['read']:>10.0f}{result['write']:>11.0f}"
+                f"{result['session_queries']:>17.2f}"
+            )
+
+    def measure(self, product, requests, logged_in=False):
+        # новый Client - новый обработчик, SessionMiddleware читает SESSION_ENGINE
+        client = Client()
+        user = None
+        if logged_in:
+            user = User.objects.create_user(f"benchmark-{time.time_ns()}")
+            client.force_login(user)
+        url = reverse("basket")
+        data = {"id": product.pk, "count": 1}
+        client.post(url, data, "application/json")
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get(url)
+            read = requests / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(requests // 2):
+                client.post(url, data, "application/json")
+                client.delete(url, data, "application/json")
+            write = (requests // 2 * 2) / (time.perf_counter() - start)
+
+        session_queries = sum(
+            "django_session" in query["sql"] for query in queries.captured_queries
+        )
+        session_key = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        if session_key:
+            Session.objects.filter(pk=session_key.value).delete()
+        if user:
+            client.logout()
+            # строки корзины удаляются вместе с пользователем
+            user.delete()
+        return {
+            "read": read,
+            "write": write,
+            "session_queries": session_queries / (requests // 2 * 2 + requests),
+        }
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет истёкшие сессии из django_session пачками по --batch-size "
+        "строк, каждая в своей короткой транзакции, чтобы не держать "
+        "блокировку таблицы долго. --pause - пауза между пачками в секундах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0)
+
+    def handle(self, *args, **options):
+        # граница фиксируется в начале, новые истёкшие подберёт следующий запуск
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        deleted = 0
+        while True:
+            keys = list(
+                expired.values_list("session_key", flat=True)[: options["batch_size"]]
+            )
+            if not keys:
+                break
+            with transaction.atomic():
+                deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions"))
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+from .cart import CART_COOKIE_SALT, encode_cart_cookie
+
+
+class CartCookieMiddleware:
+    """Записывает в ответ cookie корзины гостя, если она изменилась"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not getattr(request, "cart_cookie_changed", False):
+            return response
+        if request.cart_cookie:
+            response.set_signed_cookie(
+                settings.CART_COOKIE_NAME,
+                encode_cart_cookie(request.cart_cookie),
+                salt=CART_COOKIE_SALT,
+                max_age=settings.CART_COOKIE_AGE,
+                httponly=True,
+                samesite="Lax",
+            )
+        else:
+            response.delete_cookie(settings.CART_COOKIE_NAME, samesite="Lax")
+        return response
@@ -1,3 +1,21 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+from product.models import Product
+
+
+class CartItem(models.Model):
+    """Строка корзины авторизованного пользователя (basket.cart)"""
+
+    class Meta:
+        verbose_name = "Cart item"
+        verbose_name_plural = "Cart items"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"], name="cart_item_user_product_unique"
+            ),
+        ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="cart_items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField(default=0)
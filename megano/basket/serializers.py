@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from .cart import CART_OPERATIONS
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """Операция PATCH /api/basket: add и remove меняют количество, set задаёт"""
+
+    id = serializers.IntegerField(min_value=1)
+    count = serializers.IntegerField(min_value=0, default=1)
+    op = serializers.ChoiceField(CART_OPERATIONS, default="add")
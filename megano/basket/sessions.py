@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import db
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cache import KEY_PREFIX
+from django.core.cache import caches
+
+
+class SessionStore(db.SessionStore):
+    """
+    SESSION_ENGINE = "basket.sessions": сессии авторизованных пользователей
+    хранятся только в кэше SESSION_CACHE_ALIAS, остальные - в django_session.
+    С корзиной гостя в cookie (CART_STORAGE = "cookie") запросы магазина
+    не обращаются к django_session, а с общим кэшем (Redis, Memcached)
+    приложение может работать на нескольких узлах.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        # сессия прочитана из кэша, строки в django_session у неё нет
+        self._cached = False
+        super().__init__(session_key)
+
+    def get_cache_key(self, session_key):
+        return self.cache_key_prefix + session_key
+
+    def is_authenticated(self, no_load=False):
+        return SESSION_KEY in self._get_session(no_load=no_load)
+
+    def load(self):
+        if self.session_key is not None:
+            data = self._cache.get(self.get_cache_key(self.session_key))
+            if data is not None:
+                self._cached = True
+                return data
+        return super().load()
+
+    def exists(self, session_key):
+        if session_key and self.get_cache_key(session_key) in self._cache:
+            return True
+        return super().exists(session_key)
+
+    def save(self, must_create=False):
+        if not self.is_authenticated(no_load=must_create):
+            return super().save(must_create)
+        if self.session_key is None:
+            return self.create()
+        key = self.get_cache_key(self.session_key)
+        data = self._get_session(no_load=must_create)
+        if must_create or not self._cached:
+            if not self._cache.add(key, data, self.get_expiry_age()):
+                raise CreateError
+            if not must_create:
+                # сессия пользователя переезжает из django_session в кэш
+                super().delete(self.session_key)
+            self._cached = True
+        elif self._cache.get(key) is not None:
+            self._cache.set(key, data, self.get_expiry_age())
+        else:
+            raise UpdateError
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(self.get_cache_key(session_key))
+        if not self._cached:
+            super().delete(session_key)
+
+    def cycle_key(self):
+        # при входе ключ меняется до записи пользователя в сессию: новая
+        # сессия создаётся при сохранении, уже в кэше, без строки в БД
+        data = self._session
+        key = self.session_key
+        if key:
+            self.delete(key)
+        self._session_key = None
+        self._session_cache = data
+        self._cached = False
+        self.modified = True
@@ -1,3 +1,279 @@
-from django.test import TestCase
+import datetime
+import io
+import json
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from product.models import Category, Tag
+from product.tests import create_products
+from .models import CartItem
+from .sessions import SessionStore
+
+
+class CartDetailTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="Phones")
+        cls.products = create_products(3, cls.category, Tag.objects.create(name="New"))
+
+    def add(self, product, count=1):
+        data = {"id": product.pk, "count": count}
+        return self.client.post(reverse("basket"), data, "application/json")
+
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("basket"))
+        return response.json(), len(queries)
+
+    def test_constant_queries(self):
+        self.add(self.products[0])
+        items, queries = self.get_queries()
+        for product in self.products[1:]:
+            self.add(product, 2)
+        items, more_queries = self.get_queries()
+        self.assertEqual(queries, more_queries)
+        self.assertEqual([item["count"] for item in items], [1, 2, 2])
+        item = items[0]
+        self.assertEqual(item["category"], self.category.pk)
+        self.assertEqual(item["price"], 90)
+        self.assertEqual((item["reviews"], item["rating"]), (1, 4))
+        self.assertEqual(item["images"][0]["alt"], "Product 0")
+        self.assertEqual(
+            item["tags"], [{"id": self.products[0].tags.get().pk, "name": "New"}]
+        )
+
+    def test_deleted_product_skipped(self):
+        self.add(self.products[0])
+        session = self.client.session
+        session[settings.CART_SESSION_ID]["999"] = {"quantity": 1, "price": 10}
+        session.save()
+        items, _ = self.get_queries()
+        self.assertEqual([item["id"] for item in items], [self.products[0].pk])
+
+
+class DatabaseCartTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", password="secret")
+        cls.products = create_products(2, None, Tag.objects.create(name="New"))
+
+    def change(self, method, product, count):
+        data = {"id": product.pk, "count": count}
+        return getattr(self.client, method)(reverse("basket"), data, "application/json")
+
+    def test_merge_on_login(self):
+        self.change("post", self.products[0], 2)
+        CartItem.objects.create(user=self.user, product=self.products[0], quantity=1)
+        self.client.login(username="buyer", password="secret")
+        self.assertFalse(self.client.session.get(settings.CART_SESSION_ID))
+        items = self.client.get(reverse("basket")).json()
+        self.assertEqual(
+            [(item["id"], item["count"]) for item in items], [(self.products[0].pk, 3)]
+        )
+
+    def test_single_row_writes(self):
+        self.client.force_login(self.user)
+        self.change("post", self.products[1], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.change("post", self.products[1], 1)
+        writes = [q["sql"] for q in queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('UPDATE "basket_cartitem"', writes[0])
+        self.change("delete", self.products[1], 3)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class LazySessionTestCase(TestCase):
+    def test_reading_empty_cart_creates_no_session(self):
+        self.client.get(reverse("basket"))
+        self.assertFalse(Session.objects.exists())
+        product = create_products(1, None, Tag.objects.create(name="New"))[0]
+        data = {"id": product.pk, "count": 1}
+        self.client.post(reverse("basket"), data, "application/json")
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_sweep_expired_sessions(self):
+        now = timezone.now()
+        for i in range(5):
+            expire_date = now + datetime.timedelta(days=1 if i == 0 else -1)
+            Session.objects.create(
+                session_key=f"key{i}", session_data="", expire_date=expire_date
+            )
+        call_command("sweep_sessions", batch_size=2, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), ["key0"])
+
+
+@override_settings(CART_STORAGE="cookie")
+class CookieCartTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(2, None, Tag.objects.create(name="New"))
+
+    def add(self, product, count):
+        data = {"id": product.pk, "count": count}
+        return self.client.post(reverse("basket"), data, "application/json")
+
+    def test_cart_in_signed_cookie(self):
+        self.add(self.products[0], 2)
+        response = self.add(self.products[1], 1)
+        self.assertEqual([item["count"] for item in response.json()], [2, 1])
+        self.assertFalse(Session.objects.exists())
+        cookie = self.client.cookies[settings.CART_COOKIE_NAME].value
+        self.assertTrue(cookie.startswith(f"{self.products[0].pk}:2,"))
+
+        self.client.cookies[settings.CART_COOKIE_NAME] = cookie.replace(":2,", ":9,")
+        self.assertEqual(self.client.get(reverse("basket")).json(), [])
+
+    def test_merge_on_login(self):
+        self.add(self.products[0], 2)
+        User.objects.create_user("buyer", password="secret")
+        response = self.client.post(
+            reverse("sign-in"),
+            {'{"username": "buyer", "password": "secret"}': ""},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[settings.CART_COOKIE_NAME].value, "")
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+
+@override_settings(SESSION_ENGINE="basket.sessions")
+class CacheSessionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", password="secret")
+        cls.product = create_products(1, None, Tag.objects.create(name="New"))[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def sign_in(self):
+        credentials = '{"username": "buyer", "password": "secret"}'
+        response = self.client.post(reverse("sign-in"), {credentials: ""})
+        self.assertEqual(response.status_code, 200)
+
+    def add(self):
+        data = {"id": self.product.pk, "count": 2}
+        self.client.post(reverse("basket"), data, "application/json")
+
+    @override_settings(CART_STORAGE="cookie")
+    def test_no_session_rows(self):
+        self.add()
+        self.sign_in()
+        self.assertFalse(Session.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            items = self.client.get(reverse("basket")).json()
+        self.assertEqual([item["count"] for item in items], [2])
+        for query in queries.captured_queries:
+            self.assertNotIn("django_session", query["sql"])
+
+    @override_settings(CART_STORAGE="session")
+    def test_guest_session_moves_to_cache(self):
+        self.add()
+        self.assertTrue(Session.objects.exists())
+        self.sign_in()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 2)
+        self.assertEqual(len(self.client.get(reverse("basket")).json()), 1)
+
+    def test_store(self):
+        session = SessionStore()
+        session[SESSION_KEY] = str(self.user.pk)
+        session.save()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(
+            SessionStore(session.session_key)[SESSION_KEY], str(self.user.pk)
+        )
+
+        key = session.session_key
+        SessionStore(key).flush()
+        self.assertFalse(SessionStore().exists(key))
+        self.assertEqual(SessionStore(key).load(), {})
+
+
+class BenchmarkSessionsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_products(1, None, Tag.objects.create(name="New"))
+
+    def test_logged_in_mode(self):
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_sessions", "--mode", "user", "--requests", "4", stdout=stdout
+        )
+        mode, _, _, session_queries = stdout.getvalue().splitlines()[1].split()
+        self.assertEqual((mode, session_queries), ("user", "0.00"))
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartPatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", password="secret")
+        cls.products = create_products(3, None, Tag.objects.create(name="New"))
+
+    def patch(self, operations):
+        return self.client.patch(reverse("basket"), operations, "application/json")
+
+    def counts(self, response):
+        return [(item["id"], item["count"]) for item in response.json()]
+
+    def operations(self):
+        first, second, third = self.products
+        self.client.post(
+            reverse("basket"), {"id": first.pk, "count": 1}, "application/json"
+        )
+        return [
+            {"id": first.pk, "count": 2},
+            {"id": second.pk, "count": 3, "op": "set"},
+            {"id": third.pk, "count": 1},
+            {"id": third.pk, "op": "remove"},
+            {"id": second.pk, "count": 1, "op": "remove"},
+        ]
+
+    def test_session_cart(self):
+        response = self.patch(self.operations())
+        first, second, _ = self.products
+        self.assertEqual(self.counts(response), [(first.pk, 3), (second.pk, 2)])
+
+    def test_database_cart_single_write(self):
+        self.client.force_login(self.user)
+        operations = self.operations()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(operations)
+        writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "basket_cartitem" in query["sql"]
+            and not query["sql"].startswith("SELECT")
+        ]
+        # третий товар добавлен и удалён - остаётся один upsert
+        self.assertEqual(len(writes), 1)
+        first, second, _ = self.products
+        self.assertEqual(self.counts(response), [(first.pk, 3), (second.pk, 2)])
+
+    def test_unknown_product_changes_nothing(self):
+        response = self.patch([{"id": self.products[0].pk}, {"id": 999999}])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"id": [999999]})
+        self.assertEqual(self.client.get(reverse("basket")).json(), [])
+
+        response = self.patch([{"id": self.products[0].pk, "op": "drop"}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_body(self):
+        too_many = [{"id": self.products[0].pk}] * (settings.CART_MAX_OPERATIONS + 1)
+        for body in [5, None, "add", {"id": self.products[0].pk}, too_many]:
+            with self.subTest(body=body):
+                self.assertEqual(self.patch(json.dumps(body)).status_code, 400)
+        self.assertEqual(self.client.get(reverse("basket")).json(), [])
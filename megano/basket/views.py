@@ -1,21 +1,27 @@
+from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from product.models import Product
 from .cart import Cart
+from .serializers import CartOperationSerializer
+
+# товары корзины с изображениями и тегами за постоянное число запросов;
+# агрегаты отзывов хранятся в самом товаре
+CART_PRODUCTS = Product.objects.prefetch_related("images", "tags")
 
 
 class CartDetailView(APIView):
-    """APIView для корзины, реализация методов get, post и delete"""
+    """APIView для корзины, реализация методов get, post, patch и delete"""
 
     def get_cart_items(self, cart):
         cart_items = []
-        for item in cart:
-            product = Product.objects.get(id=item["product_id"])
+        for item in cart.items(CART_PRODUCTS):
+            product = item["product"]
             cart_item = {
                 "id": product.id,
-                "category": product.category.id,
+                "category": product.category_id,
                 "price": float(item["price"]),
                 "count": item["quantity"],
                 "date": product.date.strftime("%a %b %d %Y %H:%M:%S GMT%z (%Z)"),
@@ -29,7 +35,7 @@ class CartDetailView(APIView):
                 "tags": [
                     {"id": tag.id, "name": tag.name} for tag in product.tags.all()
                 ],
-                "reviews": product.reviews_count(),
+                "reviews": product.reviews_count,
                 "rating": product.average_rating(),
             }
             cart_items.append(cart_item)
@@ -45,7 +51,7 @@ class CartDetailView(APIView):
         quantity = int(request.data.get("count", 1))
 
         try:
-            product = Product.objects.get(id=product_id)
+            product = Product.objects.with_effective_price().get(id=product_id)
         except Product.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -54,6 +60,30 @@ class CartDetailView(APIView):
         cart_items = self.get_cart_items(cart)
         return Response(cart_items)
 
+    def patch(self, request):
+        """
+        Несколько изменений корзины за один запрос:
+        [{"id": 1, "count": 2, "op": "add"}, {"id": 5, "op": "remove"}, ...].
+        Товары проверяются одним запросом, корзина записывается один раз.
+        """
+        serializer = CartOperationSerializer(
+            data=request.data, many=True, max_length=settings.CART_MAX_OPERATIONS
+        )
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+
+        ids = {operation["id"] for operation in operations}
+        found = set(Product.objects.filter(id__in=ids).values_list("id", flat=True))
+        if ids - found:
+            return Response(
+                {"id": sorted(ids - found)}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        cart = Cart(request)
+        cart.apply(operations)
+        cart_items = self.get_cart_items(cart)
+        return Response(cart_items)
+
     def delete(self, request):
         product_id = request.data.get("id")
         quantity = request.data.get("count", 1)
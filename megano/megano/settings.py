@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "django_filters",
+    "mptt",
     "debug_toolbar",
     "frontend",
     "api",
@@ -56,6 +57,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "basket.middleware.CartCookieMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -145,6 +147,57 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CART_SESSION_ID = "cart"
 
+# Корзина гостя: "session" - в сессии, "cookie" - в подписанной cookie
+# (id товара и количество), без сессии и записи в django_session.
+# Для нескольких узлов: CART_STORAGE = "cookie" и SESSION_ENGINE =
+# "basket.sessions" (сессии авторизованных пользователей в кэше) с общим
+# кэшем (Redis, Memcached) в CACHES; корзины пользователей в CartItem.
+# Сравнение режимов: manage.py benchmark_sessions
+CART_STORAGE = "session"
+CART_COOKIE_NAME = "cart"
+CART_COOKIE_AGE = 60 * 60 * 24 * 30
+
+# Наибольшее число операций в одном PATCH /api/basket
+CART_MAX_OPERATIONS = 50
+
+# Индекс каталога в памяти процесса (product.index). Изменения из других
+# процессов подхватываются полной перестройкой раз в CATALOG_INDEX_MAX_AGE секунд
+CATALOG_INDEX_ENABLED = False
+CATALOG_INDEX_MAX_AGE = 300
+
+# Кэш страниц каталога (product.cache). Версии для инвалидации хранятся в том же
+# кэше, поэтому при нескольких процессах нужен общий бэкенд (Redis, Memcached)
+CATALOG_CACHE_TIMEOUT = 300
+
+# Документы страниц товаров (product.documents) пересобираются после коммита
+# в фоновом потоке; False - сразу в потоке запроса
+PRODUCT_DOCUMENTS_BACKGROUND = True
+
+# Рейтинг популярности (product.popularity): веса отзывов, штук в заказах и
+# просмотров, период полураспада просмотров в днях. Просмотры копятся в памяти
+# процесса и записываются пачкой. После смены весов: refresh_popularity --full
+POPULARITY_WEIGHTS = {"reviews": 1.0, "orders": 2.0, "views": 0.1}
+POPULARITY_VIEWS_HALF_LIFE = 7
+POPULARITY_VIEWS_FLUSH_SIZE = 100
+POPULARITY_VIEWS_FLUSH_INTERVAL = 60
+
+# Сколько последних отзывов входит в ответ /api/product/<pk>/, остальные
+# отдаются постранично через /api/product/<pk>/reviews
+PRODUCT_LATEST_REVIEWS = 3
+
+# Наибольшее число вложенных GET-запросов в /api/batch (product.batch)
+API_BATCH_MAX_REQUESTS = 10
+
+# Cache-Control для ответов с ETag/Last-Modified (product.conditional) по именам
+# маршрутов. ETag списков строятся по версиям в кэше, как у страниц каталога
+API_CACHE_CONTROL = {
+    "categories": {"public": True, "max_age": 300},
+    "tags_list": {"public": True, "max_age": 300},
+    "sales": {"public": True, "max_age": 60},
+    "banners": {"public": True, "max_age": 60},
+    "product_detail": {"public": True, "max_age": 60},
+}
+
 LOGIN_REDIRECT_URL = reverse_lazy("user:profile")
 LOGIN_URL = reverse_lazy("user:sign-in")
 
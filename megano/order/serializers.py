@@ -2,14 +2,17 @@ import datetime
 
 from rest_framework import serializers
 from .models import Order
+from product.prefetch import PrefetchPlannerMixin
 from product.serializers import ProductSerializer
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(PrefetchPlannerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = "__all__"
 
+    prefetch_hints = {"fullName": "user", "email": "user", "phone": "user"}
+
     products = ProductSerializer(many=True, required=True)
     fullName = serializers.StringRelatedField()
     email = serializers.StringRelatedField()
@@ -1,3 +1,73 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from product import popularity
+from product.models import Category, Tag, ProductRanking
+from product.tests import create_products
+from user.models import Profile
+from .models import Order, CountProductInOrder
+
+
+class OrderQueryCountTestCase(TestCase):
+    """Число запросов заказов не зависит от числа заказов и товаров в них"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("buyer", password="secret")
+        cls.profile = Profile.objects.create(user=user, fullName="Buyer")
+        cls.category = Category.objects.create(title="Phones")
+        cls.tag = Tag.objects.create(name="New")
+        cls.order = cls.create_order(1)
+
+    @classmethod
+    def create_order(cls, products_count):
+        order = Order.objects.create(user=cls.profile)
+        products = create_products(products_count, cls.category, cls.tag)
+        order.products.set(products)
+        for product in products:
+            CountProductInOrder.objects.create(order=order, product=product, count=1)
+        return order
+
+    def setUp(self):
+        self.client.login(username="buyer", password="secret")
+
+    def test_orders_list(self):
+        with self.assertNumQueries(9):
+            self.client.get(reverse("orders_list")).getvalue()
+        self.create_order(3)
+        with self.assertNumQueries(9):
+            body = self.client.get(reverse("orders_list")).getvalue()
+        self.assertEqual(len(json.loads(body)), 2)
+
+    def test_order_detail(self):
+        url = reverse("order_detail", kwargs={"pk": self.order.pk})
+        # корзина пользователя в CartItem: сессия больше не перезаписывается
+        with self.assertNumQueries(10):
+            self.client.get(url)
+        for product in create_products(3, self.category, self.tag):
+            self.order.products.add(product)
+            CountProductInOrder.objects.create(
+                order=self.order, product=product, count=2
+            )
+        with self.assertNumQueries(10):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["products"]), 4)
+
+
+@override_settings(POPULARITY_WEIGHTS={"reviews": 1, "orders": 2, "views": 1})
+class OrderPopularityTestCase(TestCase):
+    def test_orders_counted_once(self):
+        user = User.objects.create_user("buyer")
+        profile = Profile.objects.create(user=user, fullName="Buyer")
+        product = create_products(1, None, Tag.objects.create(name="New"))[0]
+        for _ in range(2):
+            order = Order.objects.create(user=profile)
+            CountProductInOrder.objects.create(order=order, product=product, count=3)
+            popularity.refresh()
+        ranking = ProductRanking.objects.get(pk=product.pk)
+        self.assertEqual((ranking.orders, ranking.score), (6, 13))
+        popularity.refresh(full=True)
+        self.assertEqual(ProductRanking.objects.get(pk=product.pk).orders, 6)
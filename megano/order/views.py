@@ -6,6 +6,7 @@ from basket.cart import Cart
 from .models import Order, CountProductInOrder
 from .serializers import OrderSerializer
 from product.models import Product
+from product.streaming import streaming_list_response
 
 
 class OrdersListView(APIView):
@@ -26,14 +27,15 @@ class OrdersListView(APIView):
         return Response(data)
 
     def get(self, request: Request):
-        data = Order.objects.filter(user_id=request.user.profile.pk)
-        serialized = OrderSerializer(data, many=True)
-        return Response(serialized.data)
+        data = OrderSerializer.setup_queryset(
+            Order.objects.filter(user_id=request.user.profile.pk).order_by("pk")
+        )
+        return streaming_list_response(data, OrderSerializer)
 
 
 class OrderDetailView(APIView):
     def get(self, request: Request, pk):
-        data = Order.objects.get(pk=pk)
+        data = OrderSerializer.setup_queryset(Order.objects.all()).get(pk=pk)
         serialized = OrderSerializer(data)
         cart = Cart(request).cart
         data = serialized.data
@@ -41,7 +43,7 @@ class OrderDetailView(APIView):
         try:
             products_in_order = data["products"]
             query = CountProductInOrder.objects.filter(order_id=pk)
-            prods = {obj.product.pk: obj.count for obj in query}
+            prods = {obj.product_id: obj.count for obj in query}
             for product in products_in_order:
                 product["count"] = prods[product["id"]]
         except:
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from mptt.admin import MPTTModelAdmin
 from .models import (
     Product,
     ProductImage,
@@ -12,10 +13,9 @@ from .models import (
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = "pk", "title"
-    list_display_links = "pk", "title"
-    ordering = ("pk",)
+class CategoryAdmin(MPTTModelAdmin):
+    list_display = "title", "pk"
+    list_display_links = "title", "pk"
 
 
 @admin.register(CategoryIcon)
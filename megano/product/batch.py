@@ -0,0 +1,93 @@
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+
+log = logging.getLogger(__name__)
+
+BATCH_PREFIX = "/api/"
+# заголовки запроса пакета, которые не относятся к вложенным запросам
+SKIPPED_META = {
+    "CONTENT_LENGTH",
+    "CONTENT_TYPE",
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+}
+
+
+def resolve_url(path):
+    """Как CommonMiddleware: без совпадения пробуется путь со слэшем на конце"""
+    try:
+        return path, resolve(path)
+    except Resolver404:
+        if not settings.APPEND_SLASH or path.endswith("/"):
+            raise
+    return path + "/", resolve(path + "/")
+
+
+def make_request(request: HttpRequest, path, query):
+    """
+    GET-запрос внутри пакета: пользователь, сессия и cookies общие
+    с запросом пакета, поэтому аутентификация выполняется один раз
+    """
+    subrequest = HttpRequest()
+    subrequest.method = "GET"
+    subrequest.path = subrequest.path_info = path
+    subrequest.META = {
+        key: value for key, value in request.META.items() if key not in SKIPPED_META
+    }
+    subrequest.META.update(REQUEST_METHOD="GET", PATH_INFO=path, QUERY_STRING=query)
+    subrequest.GET = QueryDict(query)
+    subrequest.COOKIES = request.COOKIES
+    subrequest.user = request.user
+    subrequest.session = request.session
+    return subrequest
+
+
+def dispatch(request: HttpRequest, url, batch_path):
+    """Выполняет url через URLconf в текущем процессе: (статус, тело JSON)"""
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path.startswith(BATCH_PREFIX):
+        return 400, JSONRenderer().render({"detail": "Expected a relative API URL"})
+    try:
+        path, match = resolve_url(parts.path)
+        if path == batch_path:
+            raise Http404
+        subrequest = make_request(request, path, parts.query)
+        subrequest.resolver_match = match
+        response = match.func(subrequest, *match.args, **match.kwargs)
+    except Http404:
+        return 404, JSONRenderer().render({"detail": "Not found."})
+    except PermissionDenied:
+        return 403, JSONRenderer().render({"detail": "Permission denied."})
+    except Exception:
+        log.exception("Batch request to %s failed", url)
+        return 500, JSONRenderer().render({"detail": "Server error."})
+
+    if hasattr(response, "render"):
+        response.render()
+    if response.streaming:
+        content = b"".join(response.streaming_content)
+    else:
+        content = response.content
+    if not response.get("Content-Type", "").startswith("application/json"):
+        content = JSONRenderer().render(content.decode(response.charset))
+    return response.status_code, content or b"null"
+
+
+def render_batch(request: HttpRequest, urls, batch_path):
+    """
+    Ответ пакета: {"responses": [{"url", "status", "body"}, ...]} в порядке
+    urls. Готовые JSON-тела вложенных ответов вставляются без повторного разбора.
+    """
+    renderer = JSONRenderer()
+    parts = []
+    for url in urls:
+        status, body = dispatch(request, url, batch_path)
+        head = renderer.render({"url": url, "status": status})
+        parts.append(head[:-1] + b',"body":' + body + b"}")
+    return b'{"responses":[' + b",".join(parts) + b"]}"
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product, Category, CategoryIcon, Tag
+
+VERSION_KEY = "catalog:version:{scope}"
+STATS_KEY = "catalog:stats:{name}"
+CATEGORIES_KEY = "categories:tree:{versions}"
+
+# Записи каталога зависят от глобальной версии, версии категории из запроса
+# (или "all" без категории) и версий выбранных тегов
+GLOBAL_SCOPE = "global"
+ALL_SCOPE = "category:all"
+
+
+def category_scope(pk):
+    return f"category:{pk}"
+
+
+def tag_scope(pk):
+    return f"tag:{pk}"
+
+
+def model_scope(model):
+    """Версия всех записей модели, повышается сигналами при любом изменении"""
+    return f"model:{model._meta.label_lower}"
+
+
+def canonical_query(request, filterset):
+    """
+    Нормализованный вид запроса каталога, не зависящий от порядка тегов,
+    формата чисел и параметров, не влияющих на результат.
+    None, если параметры не прошли валидацию.
+    """
+    if not filterset.is_valid():
+        return None
+    data = filterset.form.cleaned_data
+    params = request.query_params
+    min_price, max_price = data.get("minPrice"), data.get("maxPrice")
+    name = " ".join((data.get("name") or "").lower().split())
+    return {
+        "category": data.get("category") and int(data["category"]),
+        "minPrice": str(min_price.normalize()) if min_price else None,
+        "maxPrice": str(max_price.normalize()) if max_price is not None else None,
+        "available": bool(data.get("available")),
+        "freeDelivery": bool(data.get("freeDelivery")),
+        "tags": data.get("tags") or [],
+        "name": name,
+        "sort": params.get("sort"),
+        "sortType": params.get("sortType") == "inc",
+        "currentPage": params.get("currentPage"),
+        "limit": params.get("limit"),
+        "cursor": params.get("cursor"),
+    }
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY.format(scope=scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # после перезапуска кэша или вытеснения версия начинается заново от
+        # времени, а не с 0, иначе ETag совпал бы с выданным до изменений
+        for key in missing:
+            cache.add(key, time.time_ns())
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_versions(scopes):
+    for scope in set(scopes):
+        key = VERSION_KEY.format(scope=scope)
+        # начальное значение от времени, чтобы после вытеснения ключа версии
+        # не совпали с версиями уже сохранённых записей
+        if not cache.add(key, time.time_ns()):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns())
+
+
+def bump_versions_on_commit(scopes):
+    """
+    Версии повышаются после коммита: иначе читатель успел бы сохранить
+    старые строки под новой версией, и страница осталась бы устаревшей
+    """
+    scopes = list(scopes)
+    transaction.on_commit(lambda: bump_versions(scopes))
+
+
+def get_cache_key(request, filterset):
+    query = canonical_query(request, filterset)
+    if query is None:
+        return None
+    category = query["category"]
+    scopes = [GLOBAL_SCOPE, category_scope(category) if category else ALL_SCOPE]
+    scopes += [tag_scope(tag) for tag in query["tags"]]
+    # цены в карточках зависят от распродаж, действующих сегодня
+    day = str(timezone.localdate())
+    payload = json.dumps([query, day, get_versions(scopes)], sort_keys=True)
+    return "catalog:page:" + hashlib.sha1(payload.encode()).hexdigest()
+
+
+def get_page(key):
+    body = cache.get(key) if key else None
+    record_stat("hits" if body is not None else "misses")
+    return body
+
+
+def set_page(key, body):
+    if key:
+        cache.set(key, body, settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_categories_key():
+    scopes = [model_scope(Category), model_scope(CategoryIcon)]
+    return CATEGORIES_KEY.format(versions=":".join(map(str, get_versions(scopes))))
+
+
+def get_categories(key):
+    return cache.get(key)
+
+
+def set_categories(key, body):
+    cache.set(key, body, settings.CATALOG_CACHE_TIMEOUT)
+
+
+def record_stat(name):
+    key = STATS_KEY.format(name=name)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    hits = cache.get(STATS_KEY.format(name="hits"), 0)
+    misses = cache.get(STATS_KEY.format(name="misses"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hitRate": hits / total if total else 0,
+    }
+
+
+def invalidate_categories(category_ids):
+    """Сбрасывает выдачу категорий товаров вместе со всеми их предками"""
+    ancestors = Category.objects.none()
+    for category in Category.objects.filter(pk__in=set(category_ids) - {None}):
+        ancestors |= category.get_ancestors(include_self=True)
+    scopes = [category_scope(pk) for pk in ancestors.values_list("pk", flat=True)]
+    bump_versions_on_commit(scopes + [ALL_SCOPE])
+
+
+def invalidate_products(product_ids):
+    category_ids = Product.objects.filter(pk__in=product_ids).values_list(
+        "category_id", flat=True
+    )
+    invalidate_categories(category_ids)
+
+
+def invalidate_tags(tag_ids):
+    bump_versions_on_commit([tag_scope(pk) for pk in tag_ids])
+    tagged = Tag.product.through.objects.filter(tag_id__in=tag_ids)
+    invalidate_products(tagged.values_list("product_id", flat=True))
+
+
+def invalidate_all():
+    bump_versions_on_commit([GLOBAL_SCOPE])
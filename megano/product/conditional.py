@@ -0,0 +1,63 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import cache
+from .documents import get_document_updated_at
+
+
+def versions_etag(request, models):
+    """
+    ETag из версий моделей (product.cache) без чтения самих данных.
+    В него входят путь с параметрами и текущая дата, потому что цены
+    и список распродаж зависят от дня.
+    """
+    versions = cache.get_versions([cache.model_scope(model) for model in models])
+    key = f"{request.get_full_path()}:{timezone.localdate()}:{versions}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def document_updated_at(request, pk):
+    # ETag и Last-Modified берутся из одной строки документа, читается она один раз
+    if not hasattr(request, "_document_updated_at"):
+        request._document_updated_at = get_document_updated_at(pk)
+    return request._document_updated_at
+
+
+def document_etag(request, pk):
+    updated_at = document_updated_at(request, pk)
+    return updated_at and f'"{pk}-{updated_at.timestamp()}"'
+
+
+def conditional_get(name, models=(), etag_func=None, last_modified_func=None):
+    """
+    Декоратор метода get у APIView: отвечает 304 по If-None-Match /
+    If-Modified-Since, не вызывая сам метод, и добавляет Cache-Control
+    из settings.API_CACHE_CONTROL[name]. По умолчанию ETag строится
+    по версиям models, которые повышаются сигналами при изменениях.
+    """
+    if etag_func is None:
+
+        def etag_func(request, *args, **kwargs):
+            return versions_etag(request, models)
+
+    def decorator(method):
+        @wraps(method)
+        def get(view, request, *args, **kwargs):
+            @condition(etag_func=etag_func, last_modified_func=last_modified_func)
+            def handler(request, *args, **kwargs):
+                return method(view, request, *args, **kwargs)
+
+            response = handler(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                cache_control = settings.API_CACHE_CONTROL.get(name, {})
+                patch_cache_control(response, **cache_control)
+            return response
+
+        return get
+
+    return decorator
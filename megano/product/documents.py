@@ -0,0 +1,124 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import Product, ProductDocument, Sale
+from .serializers import ProductSerializer
+
+log = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="product-documents")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def actual_documents(pk):
+    today = timezone.localdate()
+    return ProductDocument.objects.filter(pk=pk).filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gt=today)
+    )
+
+
+def get_document(pk):
+    """Сохранённый JSON товара или None, если его нет или он устарел"""
+    return actual_documents(pk).values_list("body", flat=True).first()
+
+
+def get_document_updated_at(pk):
+    """
+    Время сборки актуального документа без чтения body, для ETag и
+    Last-Modified. None, если документа нет: чтение его не собирает.
+    """
+    return actual_documents(pk).values_list("updated_at", flat=True).first()
+
+
+def read_document(pk):
+    """
+    JSON товара для чтения: из хранилища, а при промахе товар сериализуется
+    без записи и документ пересобирается после коммита. None, если товара нет.
+    """
+    body = get_document(pk)
+    if body is None:
+        body = serialize_product(pk)
+        if body is not None:
+            transaction.on_commit(lambda: schedule([pk]))
+    return body
+
+
+def get_valid_until(pk, today):
+    """Ближайший день, когда у товара начнётся или закончится распродажа"""
+    sales = Sale.objects.filter(product_id=pk).aggregate(
+        starts=Min("dateFrom", filter=Q(dateFrom__gt=today)),
+        ends=Min("dateTo", filter=Q(dateTo__gte=today)),
+    )
+    ends = sales["ends"] and sales["ends"] + datetime.timedelta(days=1)
+    return min(filter(None, [sales["starts"], ends]), default=None)
+
+
+def serialize_product(pk):
+    """JSON товара по плану запросов ProductSerializer, None если товара нет"""
+    product = ProductSerializer.setup_queryset(Product.objects.filter(pk=pk)).first()
+    if product is None:
+        return None
+    return JSONRenderer().render(ProductSerializer(product).data)
+
+
+def render_document(pk):
+    """Сериализует товар и сохраняет документ, None если товара нет"""
+    today = timezone.localdate()
+    body = serialize_product(pk)
+    if body is None:
+        return None
+    document, _ = ProductDocument.objects.update_or_create(
+        product_id=pk,
+        defaults={"body": body, "valid_until": get_valid_until(pk, today)},
+    )
+    return document
+
+
+def invalidate_documents(product_ids):
+    """
+    Удаляет документы в текущей транзакции и после коммита пересобирает их:
+    в фоне или сразу, в зависимости от PRODUCT_DOCUMENTS_BACKGROUND
+    """
+    product_ids = set(product_ids) - {None}
+    if not product_ids:
+        return
+    ProductDocument.objects.filter(pk__in=product_ids).delete()
+    transaction.on_commit(lambda: schedule(product_ids))
+
+
+def schedule(product_ids):
+    if not settings.PRODUCT_DOCUMENTS_BACKGROUND:
+        rebuild(product_ids)
+        return
+    with _pending_lock:
+        new = set(product_ids) - _pending
+        _pending.update(new)
+    if new:
+        _executor.submit(rebuild_pending)
+
+
+def rebuild_pending():
+    with _pending_lock:
+        product_ids = set(_pending)
+        _pending.clear()
+    try:
+        rebuild(product_ids)
+    except Exception:
+        # документ пересоберётся при следующем чтении
+        log.exception("Failed to rebuild product documents %s", product_ids)
+    finally:
+        connections.close_all()
+
+
+def rebuild(product_ids):
+    for pk in product_ids:
+        render_document(pk)
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from django.db import connections
+
+HISTOGRAM_BUCKETS = 10
+
+FACETS_SQL = """
+    WITH filtered AS ({products}),
+    bounds AS (
+        SELECT MIN(effective_price) AS low, MAX(effective_price) AS high,
+            CASE WHEN MAX(effective_price) > MIN(effective_price)
+                THEN MAX(effective_price) - MIN(effective_price)
+                ELSE 1 END AS width
+        FROM filtered
+    )
+    SELECT 'price',
+        CAST((f.effective_price - b.low) * {buckets}.0 / b.width AS INTEGER),
+        COUNT(*), MIN(f.effective_price), MAX(f.effective_price),
+        SUM(CASE WHEN f.count > 0 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN f.freeDelivery THEN 1 ELSE 0 END)
+    FROM filtered f CROSS JOIN bounds b
+    GROUP BY 2
+    UNION ALL
+    SELECT 'tag', tp.tag_id, COUNT(*), NULL, NULL, NULL, NULL
+    FROM product_tag_product tp
+    WHERE tp.product_id IN (SELECT id FROM filtered)
+    GROUP BY tp.tag_id
+"""
+
+
+def facets_response(buckets, tags):
+    """
+    Собирает ответ из словаря корзин гистограммы {номер: (число товаров,
+    мин. цена, макс. цена, в наличии, с бесплатной доставкой)}
+    и словаря {id тега: число товаров}
+    """
+    total = sum(row[0] for row in buckets.values())
+    low = min((row[1] for row in buckets.values()), default=None)
+    high = max((row[2] for row in buckets.values()), default=None)
+    histogram = []
+    if total:
+        width = (high - low) / HISTOGRAM_BUCKETS
+        counts = [0] * HISTOGRAM_BUCKETS
+        for bucket, row in buckets.items():
+            # максимальная цена попадает в корзину с номером HISTOGRAM_BUCKETS
+            counts[min(bucket, HISTOGRAM_BUCKETS - 1)] += row[0]
+        histogram = [
+            {
+                "from": low + width * i,
+                "to": high if i == HISTOGRAM_BUCKETS - 1 else low + width * (i + 1),
+                "count": count,
+            }
+            for i, count in enumerate(counts)
+        ]
+    return {
+        "total": total,
+        "available": sum(row[3] for row in buckets.values()),
+        "freeDelivery": sum(row[4] for row in buckets.values()),
+        "price": {"min": low, "max": high, "histogram": histogram},
+        "tags": [
+            {"id": tag_id, "count": count} for tag_id, count in sorted(tags.items())
+        ],
+    }
+
+
+def sql_facets(queryset):
+    """Все фасеты одним запросом по отфильтрованному каталогу"""
+    products = queryset.order_by().values(
+        "id", "effective_price", "count", "freeDelivery"
+    )
+    sql, params = products.query.sql_with_params()
+    sql = FACETS_SQL.format(products=sql, buckets=HISTOGRAM_BUCKETS)
+
+    buckets, tags = {}, {}
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        for kind, key, count, low, high, available, free in cursor.fetchall():
+            if kind == "tag":
+                tags[key] = count
+            else:
+                low, high = Decimal(str(low)), Decimal(str(high))
+                buckets[key] = (count, low, high, available, free)
+    return facets_response(buckets, tags)
@@ -0,0 +1,136 @@
+import django_filters
+from django import forms
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Subquery
+from rest_framework.request import Request
+
+from .index import filter_by_ids, get_catalog_index
+from .models import Product, Category, Tag
+from .search import build_match_query
+
+
+class IntegerListField(forms.Field):
+    """Поле формы для повторяющегося параметра запроса (tags[]=1&tags[]=2)"""
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return sorted({int(item) for item in value})
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Enter a list of whole numbers.")
+
+
+class IntegerListFilter(django_filters.Filter):
+    field_class = IntegerListField
+
+
+class CatalogFilter(django_filters.FilterSet):
+    """
+    Фильтр каталога. Предикаты применяются в порядке объявления:
+    сначала те, что покрываются составными индексами Product,
+    затем теги (EXISTS) и в конце полнотекстовый поиск (FTS5),
+    который добавляет аннотацию search_rank (bm25).
+    Цена фильтруется по effective_price с учётом действующих распродаж.
+    Если включён индекс каталога в памяти, фильтрация без поиска по
+    названию выполняется им, а из базы товары загружаются по id.
+    """
+
+    category = django_filters.NumberFilter(method="filter_category")
+    minPrice = django_filters.NumberFilter(
+        field_name="effective_price", lookup_expr="gte"
+    )
+    maxPrice = django_filters.NumberFilter(
+        field_name="effective_price", lookup_expr="lte"
+    )
+    available = django_filters.BooleanFilter(method="filter_available")
+    freeDelivery = django_filters.BooleanFilter(method="filter_free_delivery")
+    tags = IntegerListFilter(method="filter_tags")
+    name = django_filters.CharFilter(method="filter_name")
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_queryset(self, queryset):
+        queryset = queryset.with_effective_price()
+        index = get_catalog_index()
+        if index is not None and not self.form.cleaned_data.get("name"):
+            ids = index.search(**self.form.cleaned_data)
+            return filter_by_ids(queryset.filter(active=True), ids)
+
+        # active=True в SQLite превращается в голое "WHERE active", которое
+        # не может использовать составные индексы (active, ...). Без поиска
+        # нужен именно индекс, а при поиске выборку должен вести индекс FTS5,
+        # иначе SQLite выполняет MATCH заново для каждой строки товара.
+        if self.get_match_query(queryset):
+            queryset = queryset.filter(active=True)
+        else:
+            queryset = queryset.filter(active__in=[True])
+        return super().filter_queryset(queryset)
+
+    def get_match_query(self, queryset):
+        if connections[queryset.db].vendor != "sqlite":
+            return ""
+        return build_match_query(self.form.cleaned_data.get("name"))
+
+    def filter_category(self, queryset, name, value):
+        # поддерево любой глубины одним диапазоном по индексу (tree_id, lft)
+        root = Category.objects.filter(pk=value)
+        subtree = Category.objects.filter(
+            tree_id=Subquery(root.values("tree_id")),
+            lft__gte=Subquery(root.values("lft")),
+            lft__lte=Subquery(root.values("rght")),
+        )
+        return queryset.filter(category_id__in=subtree.values("pk"))
+
+    def filter_available(self, queryset, name, value):
+        if value:
+            return queryset.filter(count__gt=0)
+        return queryset
+
+    def filter_free_delivery(self, queryset, name, value):
+        if value:
+            return queryset.filter(freeDelivery=True)
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        tagged = Tag.product.through.objects.filter(
+            product_id=OuterRef("pk"), tag_id__in=value
+        )
+        return queryset.filter(Exists(tagged))
+
+    def filter_name(self, queryset, name, value):
+        query = self.get_match_query(queryset)
+        if not query:
+            return queryset.filter(title__icontains=value)
+        return queryset.filter(search_index__document__match=query).annotate(
+            search_rank=F("search_index__rank")
+        )
+
+
+def catalog_params(request: Request):
+    """Приводит параметры запроса каталога к полям CatalogFilter"""
+    params = request.query_params
+    data = {
+        "name": params.get("filter[name]"),
+        "minPrice": params.get("filter[minPrice]"),
+        "maxPrice": params.get("filter[maxPrice]"),
+        "available": params.get("filter[available]"),
+        "freeDelivery": params.get("filter[freeDelivery]"),
+        "tags": params.getlist("tags[]"),
+        "category": params.get("category"),
+    }
+    if data["category"]:
+        return data
+
+    # старые клиенты передают категорию и поиск из шапки только в HTTP_REFERER
+    referer = request.META.get("HTTP_REFERER", "").split("/")
+    category = referer[4] if len(referer) > 4 else ""
+    if category.isdigit():
+        data["category"] = category
+    elif category.startswith("?filter=") and not data["name"]:
+        data["name"] = category.split("=")[1]
+    return data
@@ -0,0 +1,301 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .facets import HISTOGRAM_BUCKETS, facets_response
+from .models import Product, Category, Tag
+
+
+def ids_to_bitset(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        bits[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(bits, "little")
+
+
+def bitset_to_ids(bitset):
+    bits = bin(bitset)[:1:-1]
+    ids = []
+    pk = bits.find("1")
+    while pk != -1:
+        ids.append(pk)
+        pk = bits.find("1", pk + 1)
+    return ids
+
+
+def filter_by_ids(queryset, ids):
+    if connections[queryset.db].vendor == "sqlite":
+        # один параметр вместо тысяч: SQLite ограничивает число параметров
+        ids = RawSQL("SELECT value FROM json_each(%s)", [json.dumps(ids)])
+    return queryset.filter(pk__in=ids)
+
+
+class CatalogIndex:
+    """
+    Индекс каталога в памяти процесса: битовые множества активных товаров
+    по категориям, бесплатной доставке и наличию, множества товаров по
+    тегам (пересекаются с активными при поиске), плюс отсортированный
+    столбец цен с учётом распродаж. Фильтрация сводится к пересечению
+    множеств, после чего товары загружаются одним запросом по id.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built_at = 0.0
+        # изменения, пришедшие во время перестройки, повторяются после неё
+        self.journal = None
+        self.products = {}
+        self.prices = []
+        self.all = 0
+        self.in_stock = 0
+        self.free_delivery = 0
+        self.by_category = {}
+        self.by_tag = {}
+        self.children = {}
+
+    def build(self):
+        """
+        Читает базу и собирает новые множества без блокировки, поиск в это
+        время идёт по старым; затем данные подменяются целиком
+        """
+        with self.lock:
+            self.journal = []
+        try:
+            data = self.load()
+        except Exception:
+            with self.lock:
+                self.journal = None
+            raise
+        with self.lock:
+            journal, self.journal = self.journal, None
+            self.__dict__.update(data)
+            self.built_at = time.monotonic()
+        for method, args in journal:
+            getattr(self, method)(*args)
+
+    def record(self, method, *args):
+        if self.journal is not None:
+            self.journal.append((method, args))
+
+    def load(self):
+        rows = list(
+            Product.objects.filter(active=True)
+            .with_effective_price()
+            .values_list(
+                "pk", "category_id", "effective_price", "count", "freeDelivery"
+            )
+        )
+        by_category = defaultdict(list)
+        for pk, category_id, *_ in rows:
+            by_category[category_id].append(pk)
+        by_tag = defaultdict(list)
+        through = Tag.product.through.objects.values_list("tag_id", "product_id")
+        for tag_id, product_id in through:
+            by_tag[tag_id].append(product_id)
+        children = defaultdict(set)
+        for pk, parent_id in Category.objects.values_list("pk", "parent_id"):
+            if parent_id is not None:
+                children[parent_id].add(pk)
+
+        products = {pk: (category_id, price) for pk, category_id, price, *_ in rows}
+        return {
+            "products": products,
+            "prices": sorted((price, pk) for pk, _, price, *_ in rows),
+            "all": ids_to_bitset(products),
+            "in_stock": ids_to_bitset(row[0] for row in rows if row[3] > 0),
+            "free_delivery": ids_to_bitset(row[0] for row in rows if row[4]),
+            "by_category": {
+                category_id: ids_to_bitset(ids)
+                for category_id, ids in by_category.items()
+            },
+            "by_tag": {tag_id: ids_to_bitset(ids) for tag_id, ids in by_tag.items()},
+            "children": dict(children),
+        }
+
+    def update(self, pk, active, category_id, price, count, free_delivery):
+        with self.lock:
+            self.discard(pk)
+            if not active:
+                return
+            bit = 1 << pk
+            self.products[pk] = (category_id, price)
+            insort(self.prices, (price, pk))
+            self.all |= bit
+            if count > 0:
+                self.in_stock |= bit
+            if free_delivery:
+                self.free_delivery |= bit
+            self.by_category[category_id] = self.by_category.get(category_id, 0) | bit
+
+    def refresh(self, pk):
+        with self.lock:
+            self.record("refresh", pk)
+        row = (
+            Product.objects.filter(pk=pk)
+            .with_effective_price()
+            .values_list(
+                "active", "category_id", "effective_price", "count", "freeDelivery"
+            )
+            .first()
+        )
+        if row is None:
+            self.discard(pk)
+        else:
+            self.update(pk, *row)
+
+    def remove(self, pk):
+        with self.lock:
+            self.record("remove", pk)
+            self.discard(pk)
+
+    def discard(self, pk):
+        with self.lock:
+            if pk not in self.products:
+                return
+            category_id, price = self.products.pop(pk)
+            del self.prices[bisect_left(self.prices, (price, pk))]
+            mask = ~(1 << pk)
+            self.all &= mask
+            self.in_stock &= mask
+            self.free_delivery &= mask
+            self.by_category[category_id] &= mask
+
+    def tag(self, tag_id, product_ids):
+        with self.lock:
+            self.record("tag", tag_id, product_ids)
+            tagged = ids_to_bitset(product_ids)
+            self.by_tag[tag_id] = self.by_tag.get(tag_id, 0) | tagged
+
+    def untag(self, tag_id, product_ids=None):
+        with self.lock:
+            self.record("untag", tag_id, product_ids)
+            if product_ids is None:
+                self.by_tag.pop(tag_id, None)
+            elif tag_id in self.by_tag:
+                self.by_tag[tag_id] &= ~ids_to_bitset(product_ids)
+
+    def set_parent(self, pk, parent_id):
+        with self.lock:
+            self.record("set_parent", pk, parent_id)
+            for children in self.children.values():
+                children.discard(pk)
+            if parent_id is not None:
+                self.children.setdefault(parent_id, set()).add(pk)
+
+    def descendants(self, pk):
+        subtree = [pk]
+        for category_id in subtree:
+            subtree.extend(self.children.get(category_id, ()))
+        return subtree
+
+    def search(self, category=None, minPrice=None, maxPrice=None, tags=None, **flags):
+        """Возвращает список id активных товаров, подходящих под фильтр"""
+        with self.lock:
+            result = self.all
+            if category is not None:
+                in_subtree = 0
+                for pk in self.descendants(int(category)):
+                    in_subtree |= self.by_category.get(pk, 0)
+                result &= in_subtree
+            if flags.get("available"):
+                result &= self.in_stock
+            if flags.get("freeDelivery"):
+                result &= self.free_delivery
+            if tags:
+                tagged = 0
+                for tag_id in tags:
+                    tagged |= self.by_tag.get(tag_id, 0)
+                result &= tagged
+            if minPrice is None and maxPrice is None:
+                return bitset_to_ids(result)
+            return self.filter_price(result, minPrice, maxPrice)
+
+    def filter_price(self, bitset, low, high):
+        start = 0 if low is None else bisect_left(self.prices, (low,))
+        stop = len(self.prices)
+        if high is not None:
+            stop = bisect_right(self.prices, (high, float("inf")))
+        if stop - start < bin(bitset).count("1"):
+            in_range = ids_to_bitset(pk for _, pk in self.prices[start:stop])
+            return bitset_to_ids(bitset & in_range)
+        return [
+            pk
+            for pk in bitset_to_ids(bitset)
+            if (low is None or self.products[pk][1] >= low)
+            and (high is None or self.products[pk][1] <= high)
+        ]
+
+    def facets(self, **params):
+        with self.lock:
+            ids = self.search(**params)
+            matched = ids_to_bitset(ids)
+            prices = [self.products[pk][1] for pk in ids]
+            in_stock = set(bitset_to_ids(self.in_stock & matched))
+            free_delivery = set(bitset_to_ids(self.free_delivery & matched))
+            tags = {}
+            for tag_id, tagged in self.by_tag.items():
+                count = bin(tagged & matched).count("1")
+                if count:
+                    tags[tag_id] = count
+
+        buckets = {}
+        if prices:
+            low, high = min(prices), max(prices)
+            width = high - low or 1
+            for pk, price in zip(ids, prices):
+                bucket = int((price - low) * HISTOGRAM_BUCKETS / width)
+                count, _, _, available, free = buckets.get(bucket, (0, 0, 0, 0, 0))
+                buckets[bucket] = (
+                    count + 1,
+                    low,
+                    high,
+                    available + (pk in in_stock),
+                    free + (pk in free_delivery),
+                )
+        return facets_response(buckets, tags)
+
+
+_catalog_index = CatalogIndex()
+_build_lock = threading.Lock()
+
+
+def is_stale(index):
+    age = time.monotonic() - index.built_at
+    return not index.built_at or age > settings.CATALOG_INDEX_MAX_AGE
+
+
+def get_catalog_index():
+    """
+    Индекс каталога, если он включён в настройках. Строится лениво при
+    первом обращении в процессе и перестраивается через
+    CATALOG_INDEX_MAX_AGE секунд, чтобы ограничить рассинхронизацию
+    с изменениями, сделанными другими процессами. Перестраивает один
+    поток, остальные тем временем ищут по прежним данным.
+    """
+    if not settings.CATALOG_INDEX_ENABLED:
+        return None
+    if is_stale(_catalog_index):
+        # первую сборку ждут все, перестройку - только тот, кто её начал
+        if _build_lock.acquire(blocking=not _catalog_index.built_at):
+            try:
+                if is_stale(_catalog_index):
+                    _catalog_index.build()
+            finally:
+                _build_lock.release()
+    return _catalog_index
+
+
+def get_built_catalog_index():
+    """Индекс для инкрементального обновления: None, если он ещё не строился"""
+    if settings.CATALOG_INDEX_ENABLED and _catalog_index.built_at:
+        return _catalog_index
+    return None
@@ -0,0 +1,86 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from product.models import Product
+from product.serializers import ProductShortSerializer
+from product.streaming import CHUNK_SIZE, streaming_list_response
+
+MODES = ("full", "stream")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает сборку списка товаров целиком (Response) и потоковую "
+        "отдачу (streaming_list_response): пиковый RSS, время до первого "
+        "байта и общее время. Каждый режим запускается в отдельном процессе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=20000)
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--mode", choices=MODES)
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            result = self.measure(
+                options["mode"], options["count"], options["chunk_size"]
+            )
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(
+            f"{'mode':<8}{'items':>8}{'MB':>8}{'rss MB':>10}"
+            f"{'+rss MB':>10}{'ttfb ms':>10}{'total ms':>10}"
+        )
+        for mode in MODES:
+            command = [sys.argv[0], "benchmark_list_rendering", "--mode", mode]
+            command += ["--count", str(options["count"])]
+            command += ["--chunk-size", str(options["chunk_size"])]
+            output = subprocess.run(
+                [sys.executable, *command], capture_output=True, check=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<8}{result['items']:>8}{result['bytes'] / 2**20:>8.1f}"
+                f"{result['rss']:>10.1f}{result['rss'] - result['rss_before']:>10.1f}"
+                f"{result['ttfb'] * 1000:>10.1f}{result['total'] * 1000:>10.1f}"
+            )
+
+    def measure(self, mode, count, chunk_size):
+        products = Product.objects.order_by("pk")[:count]
+        products = ProductShortSerializer.setup_queryset(products)
+        items = products.count()
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        if mode == "full":
+            data = ProductShortSerializer(products, many=True).data
+            chunks = [JSONRenderer().render({"items": data})]
+        else:
+            response = streaming_list_response(
+                products, ProductShortSerializer, key="items", chunk_size=chunk_size
+            )
+            chunks = response.streaming_content
+        ttfb, size = None, 0
+        for chunk in chunks:
+            # байты "отправляются" и не хранятся, как при отдаче клиенту
+            ttfb = ttfb or time.perf_counter() - start
+            size += len(chunk)
+        return {
+            "mode": mode,
+            "items": items,
+            "bytes": size,
+            "rss_before": rss_before,
+            "rss": peak_rss_mb(),
+            "ttfb": ttfb,
+            "total": time.perf_counter() - start,
+        }
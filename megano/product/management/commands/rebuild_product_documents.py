@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from product.documents import render_document
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сохранённые JSON-документы страниц товаров."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["product_ids"]:
+            products = products.filter(pk__in=options["product_ids"])
+        product_ids = list(products.values_list("pk", flat=True))
+        for pk in product_ids:
+            render_document(pk)
+        self.stdout.write(self.style.SUCCESS(f"Rendered {len(product_ids)} documents"))
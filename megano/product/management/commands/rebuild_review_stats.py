@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product.models import Product, Review
+from product.reviews import rebuild_review_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает число отзывов, сумму и гистограмму оценок товаров. "
+        "Нужен после загрузки отзывов фикстурами или правок в обход ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["product_ids"]:
+            products = products.filter(pk__in=options["product_ids"])
+        with transaction.atomic():
+            updated = rebuild_review_stats(products, Review.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} products"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from product.popularity import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рейтинг популярности товаров для блока популярных. "
+        "Запускается периодически (cron); --full пересчитывает всё заново."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true")
+
+    def handle(self, *args, **options):
+        refresh(full=options["full"])
+        self.stdout.write(self.style.SUCCESS("Popularity ranking refreshed"))
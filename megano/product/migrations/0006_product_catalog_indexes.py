@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0005_sale_price"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["active", "category", "price"],
+                name="product_active_cat_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["active", "count"], name="product_active_count_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["active", "freeDelivery"], name="product_active_delivery_idx"
+            ),
+        ),
+    ]
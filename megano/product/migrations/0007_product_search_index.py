@@ -0,0 +1,48 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import product.search
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0006_product_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchIndex",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="product.product",
+                    ),
+                ),
+                ("title", models.TextField()),
+                ("description", models.TextField()),
+                ("fullDescription", models.TextField()),
+                ("tags", models.TextField()),
+                (
+                    "document",
+                    product.search.SearchDocumentField(db_column="product_fts"),
+                ),
+                ("rank", models.FloatField(db_column="rank")),
+            ],
+            options={
+                "db_table": "product_fts",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(
+            product.search.create_search_index,
+            product.search.drop_search_index,
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mptt.fields
+
+
+def build_category_tree(apps, schema_editor):
+    """
+    Заполняет поля MPTT для существующих категорий. Корневые категории
+    в старых данных ссылались сами на себя, такие ссылки обнуляются.
+    """
+    Category = apps.get_model("product", "Category")
+    Category.objects.filter(parent_id=models.F("pk")).update(parent=None)
+
+    children = {}
+    for category in Category.objects.order_by("pk"):
+        children.setdefault(category.parent_id, []).append(category)
+
+    def walk(category, tree_id, level, lft):
+        category.tree_id, category.level, category.lft = tree_id, level, lft
+        rght = lft + 1
+        for child in children.get(category.pk, []):
+            rght = walk(child, tree_id, level + 1, rght) + 1
+        category.rght = rght
+        category.save(update_fields=["tree_id", "level", "lft", "rght"])
+        return rght
+
+    for tree_id, root in enumerate(children.get(None, []), start=1):
+        walk(root, tree_id, 0, 1)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0007_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="level",
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="lft",
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="rght",
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="tree_id",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="category",
+            name="parent",
+            field=mptt.fields.TreeForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="subcategories",
+                to="product.category",
+            ),
+        ),
+        migrations.AlterIndexTogether(
+            name="category",
+            index_together={("tree_id", "lft")},
+        ),
+        migrations.RunPython(build_category_tree, migrations.RunPython.noop),
+    ]
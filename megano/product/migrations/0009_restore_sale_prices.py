@@ -0,0 +1,24 @@
+# Generated by Django 4.2.2 on 2026-10-18 19:05
+
+from django.db import migrations
+
+
+def restore_sale_prices(apps, schema_editor):
+    # раньше сериализатор записывал цену распродажи в Product.price,
+    # исходная цена сохранилась в Sale.price
+    Sale = apps.get_model("product", "Sale")
+    for sale in Sale.objects.select_related("product").filter(price__gt=0):
+        product = sale.product
+        if product.price == sale.salePrice and product.price != sale.price:
+            product.price = sale.price
+            product.save(update_fields=["price"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0008_category_tree"),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_sale_prices, migrations.RunPython.noop),
+    ]
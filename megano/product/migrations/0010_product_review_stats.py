@@ -0,0 +1,75 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import product.reviews
+import product.search
+
+
+def rebuild_review_stats(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    Review = apps.get_model("product", "Review")
+    product.reviews.rebuild_review_stats(Product.objects.all(), Review.objects.all())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0009_restore_sale_prices"),
+    ]
+
+    operations = [
+        # SQLite пересоздаёт product_product, триггеры FTS мешают переименованию
+        migrations.RunPython(
+            product.search.drop_search_triggers, product.search.create_search_triggers
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_1",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_2",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_3",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_4",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_5",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="reviews_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["active", "reviews_count"], name="product_active_reviews_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["active", "rating"], name="product_active_rating_idx"
+            ),
+        ),
+        migrations.RunPython(
+            product.search.create_search_triggers, product.search.drop_search_triggers
+        ),
+        migrations.RunPython(rebuild_review_stats, migrations.RunPython.noop),
+    ]
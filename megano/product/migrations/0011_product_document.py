@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0010_product_review_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="document",
+                        serialize=False,
+                        to="product.product",
+                    ),
+                ),
+                ("body", models.BinaryField()),
+                ("valid_until", models.DateField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0011_product_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductRanking",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="ranking",
+                        serialize=False,
+                        to="product.product",
+                    ),
+                ),
+                ("reviews", models.PositiveIntegerField(default=0)),
+                ("orders", models.PositiveIntegerField(default=0)),
+                ("views", models.FloatField(default=0)),
+                ("new_views", models.PositiveIntegerField(default=0)),
+                ("score", models.FloatField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RankingState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("refreshed_at", models.DateTimeField(null=True)),
+                ("last_order_line", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0012_product_ranking"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["dateTo", "dateFrom"], name="sale_window_idx"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0013_sale_window_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["product", "date"], name="review_product_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0014_review_product_date_index"),
+    ]
+
+    operations = [
+        # index_together добавляет django-mptt во время выполнения, автодетектор
+        # его не видит и предлагал удалить индекс; теперь он в Meta.indexes
+        migrations.AlterIndexTogether(
+            name="category",
+            index_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(fields=["tree_id", "lft"], name="category_tree_lft_idx"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0015_category_tree_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="rating",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=3
+            ),
+        ),
+    ]
@@ -1,15 +1,25 @@
 from django.db import models
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from mptt.models import MPTTModel, TreeForeignKey
 
+from .search import FTS_TABLE, SearchDocumentField
 
-class Category(models.Model):
+
+class Category(MPTTModel):
     class Meta:
         verbose_name = "Category"
         verbose_name_plural = "Categories"
+        indexes = [
+            # поддерево категории - диапазон lft внутри дерева (CatalogFilter)
+            models.Index(fields=["tree_id", "lft"], name="category_tree_lft_idx"),
+        ]
 
     title = models.CharField(max_length=128, db_index=True)
     active = models.BooleanField(default=False)
     favourite = models.BooleanField(default=False)
-    parent = models.ForeignKey(
+    parent = TreeForeignKey(
         "self",
         on_delete=models.PROTECT,
         blank=True,
@@ -51,10 +61,83 @@ class CategoryIcon(models.Model):
         return f"Icon: Category={self.category.title}"
 
 
+REVIEW_STATS_FIELDS = {
+    "reviews_count",
+    "rating_sum",
+    "rating",
+    "rating_1",
+    "rating_2",
+    "rating_3",
+    "rating_4",
+    "rating_5",
+}
+
+
+# Столбцы, которые нужны карточке товара в списках (ProductShortSerializer)
+CARD_FIELDS = (
+    "id",
+    "category",
+    "price",
+    "count",
+    "date",
+    "title",
+    "description",
+    "freeDelivery",
+    "reviews_count",
+    "rating",
+)
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_effective_price(self, day=None):
+        """
+        Аннотирует effective_price: минимальная цена распродажи, действующей
+        в день day (по умолчанию сегодня), либо обычная цена товара
+        """
+        if "effective_price" in self.query.annotations:
+            return self
+        day = day or timezone.localdate()
+        sales = (
+            Sale.objects.active(day)
+            .filter(product_id=OuterRef("pk"))
+            .order_by("salePrice")
+            .values("salePrice")[:1]
+        )
+        return self.annotate(
+            effective_price=Coalesce(
+                Subquery(sales),
+                "price",
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+
+    def cards(self):
+        """Только столбцы и связи, которые выводятся в карточке товара"""
+        images = ProductImage.objects.only("product_id", "name", "image")
+        return self.only(*CARD_FIELDS).prefetch_related(
+            models.Prefetch("images", queryset=images),
+            models.Prefetch("tags", queryset=Tag.objects.only("id", "name")),
+        )
+
+
 class Product(models.Model):
     class Meta:
         verbose_name = "Product"
         verbose_name_plural = "Products"
+        indexes = [
+            models.Index(
+                fields=["active", "category", "price"],
+                name="product_active_cat_price_idx",
+            ),
+            models.Index(fields=["active", "count"], name="product_active_count_idx"),
+            models.Index(
+                fields=["active", "freeDelivery"], name="product_active_delivery_idx"
+            ),
+            models.Index(
+                fields=["active", "reviews_count"], name="product_active_reviews_idx"
+            ),
+            models.Index(fields=["active", "rating"], name="product_active_rating_idx"),
+        ]
 
     category = models.ForeignKey(
         Category,
@@ -72,22 +155,104 @@ class Product(models.Model):
     freeDelivery = models.BooleanField(default=True)
     active = models.BooleanField(default=False)
     limited_edition = models.BooleanField(default=False)
-    rating = models.DecimalField(default=0, max_digits=3, decimal_places=2, null=False)
+
+    # агрегаты отзывов, обновляются сигналами Review (product.reviews)
+    rating = models.DecimalField(
+        default=0, max_digits=3, decimal_places=2, null=False, editable=False
+    )
+    reviews_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return f"Product(pk={self.pk}, name={self.title!r})"
 
-    def reviews_count(self):
-        return self.reviews.count()
+    def save(self, *args, **kwargs):
+        # агрегаты отзывов меняются только через UPDATE с F-выражениями,
+        # сохранение загруженного ранее товара не должно их затирать
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in REVIEW_STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def average_rating(self):
-        total_reviews = self.reviews.count()
-        if total_reviews > 0:
-            total_rating = sum(review.rate for review in self.reviews.all())
-            return total_rating / total_reviews
+        if self.reviews_count > 0:
+            return self.rating_sum / self.reviews_count
         return 0
 
 
+class ProductSearchIndex(models.Model):
+    """
+    Полнотекстовый индекс товаров (виртуальная таблица FTS5).
+    Создаётся миграцией и поддерживается триггерами в SQLite.
+    """
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_index",
+    )
+    title = models.TextField()
+    description = models.TextField()
+    fullDescription = models.TextField()
+    tags = models.TextField()
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField(db_column="rank")
+
+
+class ProductDocument(models.Model):
+    """
+    Готовый JSON страницы товара (product.documents). valid_until - день,
+    когда начинается или заканчивается распродажа и меняется цена.
+    """
+
+    product = models.OneToOneField(
+        Product, primary_key=True, on_delete=models.CASCADE, related_name="document"
+    )
+    body = models.BinaryField()
+    valid_until = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ProductRanking(models.Model):
+    """
+    Рейтинг популярности товара (product.popularity). views - просмотры
+    с затуханием на момент последнего пересчёта, new_views - просмотры после него.
+    """
+
+    product = models.OneToOneField(
+        Product, primary_key=True, on_delete=models.CASCADE, related_name="ranking"
+    )
+    reviews = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    views = models.FloatField(default=0)
+    new_views = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0, db_index=True)
+
+
+class RankingState(models.Model):
+    """Состояние пересчёта рейтинга: время и последняя учтённая строка заказа"""
+
+    refreshed_at = models.DateTimeField(null=True)
+    last_order_line = models.PositiveIntegerField(default=0)
+
+
 def product_images_directory_path(instance: "ProductImage", filename: str) -> str:
     return "products/product_{pk}/images/{filename}".format(
         pk=instance.product.pk,
@@ -134,6 +299,10 @@ class Review(models.Model):
     class Meta:
         verbose_name = "Review"
         verbose_name_plural = "Reviews"
+        indexes = [
+            # отзывы товара по дате: страницы отзывов и последние в карточке
+            models.Index(fields=["product", "date"], name="review_product_date_idx"),
+        ]
 
     author = models.CharField(max_length=128)
     email = models.EmailField(max_length=256)
@@ -166,10 +335,23 @@ class ProductSpecification(models.Model):
     )
 
 
+class SaleQuerySet(models.QuerySet):
+    def active(self, day=None):
+        """Распродажи, действующие в день day (по умолчанию сегодня)"""
+        day = day or timezone.localdate()
+        return self.filter(dateFrom__lte=day).filter(
+            Q(dateTo__isnull=True) | Q(dateTo__gte=day)
+        )
+
+
 class Sale(models.Model):
     class Meta:
         verbose_name = "Sale"
         verbose_name_plural = "Sales"
+        indexes = [
+            # окно действия: dateTo IS NULL или dateTo >= день, затем dateFrom
+            models.Index(fields=["dateTo", "dateFrom"], name="sale_window_idx"),
+        ]
 
     price = models.DecimalField(
         max_digits=10, db_index=True, decimal_places=2, default=0
@@ -183,11 +365,13 @@ class Sale(models.Model):
         Product, on_delete=models.CASCADE, related_name="sales", verbose_name="product"
     )
 
+    objects = SaleQuerySet.as_manager()
+
     def title(self):
         return self.product.title
 
     def href(self):
-        return f"/product/{self.product.pk}"
+        return f"/product/{self.product_id}"
 
     def __str__(self):
         return self.product.title
@@ -0,0 +1,138 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+
+class CatalogPagination(BasePagination):
+    """
+    Keyset пагинация каталога с полями currentPage/lastPage для фронтенда.
+    Курсор nextCursor хранит номер следующей страницы и значения полей
+    сортировки последнего товара; с курсором параметр currentPage не нужен
+    """
+
+    page_query_param = "currentPage"
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request: Request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.current_page = self.get_page_number(request)
+        ordering = queryset.query.order_by
+        self.fields = [field.lstrip("-") for field in ordering]
+        self.descending = [field.startswith("-") for field in ordering]
+        self.model_fields = [
+            self.get_ordering_field(queryset, field) for field in self.fields
+        ]
+        self.last_page = max(math.ceil(queryset.count() / self.page_size), 1)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            self.current_page, position = self.decode_cursor(cursor)
+            queryset = queryset.filter(self.get_keyset_filter(position))
+            page = list(queryset[: self.page_size + 1])
+        else:
+            offset = (self.current_page - 1) * self.page_size
+            page = list(queryset[offset : offset + self.page_size + 1])
+
+        has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "items": data,
+                "currentPage": self.current_page,
+                "lastPage": self.last_page,
+                "nextCursor": self.next_cursor,
+            }
+        )
+
+    def get_page_size(self, request: Request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_page_number(self, request: Request):
+        try:
+            return max(int(request.query_params[self.page_query_param]), 1)
+        except (KeyError, ValueError):
+            return 1
+
+    def get_ordering_field(self, queryset, name):
+        # поле модели или аннотации (effective_price, search_rank)
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, instance):
+        position = [getattr(instance, field) for field in self.fields]
+        data = json.dumps([self.current_page + 1, *position], default=str).encode()
+        return urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        Значения курсора приводятся к типам полей сортировки: подделанный
+        курсор даёт 404, а не ошибку при построении запроса
+        """
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+            if not isinstance(position, list) or len(position) != len(self.fields) + 1:
+                raise ValueError(cursor)
+            page = position.pop(0)
+            if type(page) is not int or page < 1:
+                raise ValueError(cursor)
+            position = [
+                field.to_python(value)
+                for field, value in zip(self.model_fields, position)
+            ]
+        except (ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return page, position
+
+    def get_keyset_filter(self, position):
+        """
+        Строит условие "строго после курсора" для упорядочивания вида
+        (поле сортировки, id): (a > x) OR (a = x AND b > y) ...
+        """
+        keyset = Q()
+        equal = Q()
+        for field, desc, value in zip(self.fields, self.descending, position):
+            lookup = "lt" if desc else "gt"
+            keyset |= equal & Q(**{f"{field}__{lookup}": value})
+            equal &= Q(**{field: value})
+        return keyset
+
+
+class SalesPagination(PageNumberPagination):
+    """Постраничный вывод распродаж с полями currentPage/lastPage для фронтенда"""
+
+    page_query_param = "currentPage"
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "items": data,
+                "currentPage": self.page.number,
+                "lastPage": self.page.paginator.num_pages,
+            }
+        )
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Max, OuterRef, Q, Subquery, Sum
+from django.db.models import Value, When
+from django.db.models.lookups import LessThan
+from django.utils import timezone
+
+from .models import Product, ProductRanking, RankingState
+
+POPULAR_LIMIT = 8
+BATCH_SIZE = 1000
+# просмотры ниже порога после затухания обнуляются
+MIN_VIEWS = 0.01
+
+_views = Counter()
+_views_lock = threading.Lock()
+_views_flushed = time.monotonic()
+
+
+def record_view(pk):
+    """
+    Просмотр товара копится в памяти процесса и записывается в new_views
+    пачкой, раз в POPULARITY_VIEWS_FLUSH_SIZE просмотров или
+    POPULARITY_VIEWS_FLUSH_INTERVAL секунд. Несохранённые просмотры при
+    остановке процесса теряются.
+    """
+    with _views_lock:
+        _views[pk] += 1
+        due = (
+            sum(_views.values()) >= settings.POPULARITY_VIEWS_FLUSH_SIZE
+            or time.monotonic() - _views_flushed
+            >= settings.POPULARITY_VIEWS_FLUSH_INTERVAL
+        )
+    if due:
+        flush_views()
+
+
+def flush_views():
+    global _views_flushed
+    with _views_lock:
+        views = dict(_views)
+        _views.clear()
+        _views_flushed = time.monotonic()
+    if views:
+        save_views(views)
+
+
+def save_views(views):
+    existing = Product.objects.filter(pk__in=views).values_list("pk", flat=True)
+    with transaction.atomic():
+        ProductRanking.objects.bulk_create(
+            [ProductRanking(product_id=pk) for pk in existing],
+            ignore_conflicts=True,
+        )
+        for pk, count in views.items():
+            ProductRanking.objects.filter(pk=pk).update(
+                new_views=F("new_views") + count
+            )
+
+
+def score(reviews, orders, views):
+    weights = settings.POPULARITY_WEIGHTS
+    return (
+        weights["reviews"] * reviews
+        + weights["orders"] * orders
+        + weights["views"] * views
+    )
+
+
+def refresh(full=False):
+    """
+    Пересчитывает рейтинг. Обычный пересчёт учитывает только новые строки
+    заказов, изменившиеся счётчики отзывов и просмотры, а затухание применяет
+    к товарам с ненулевыми просмотрами. full=True считает всё заново,
+    например после смены весов.
+    """
+    from order.models import CountProductInOrder
+
+    with transaction.atomic():
+        state, _ = RankingState.objects.select_for_update().get_or_create(pk=1)
+        now = timezone.now()
+        full = full or state.refreshed_at is None
+        decay = 1.0
+        if not full:
+            days = (now - state.refreshed_at).total_seconds() / 86400
+            decay = 0.5 ** (days / settings.POPULARITY_VIEWS_HALF_LIFE)
+
+        missing = list(
+            Product.objects.filter(ranking__isnull=True).values_list("pk", flat=True)
+        )
+        for start in range(0, len(missing), BATCH_SIZE):
+            ProductRanking.objects.bulk_create(
+                [
+                    ProductRanking(product_id=pk)
+                    for pk in missing[start : start + BATCH_SIZE]
+                ],
+                ignore_conflicts=True,
+            )
+
+        rankings = ProductRanking.objects.all()
+        reviews = rankings
+        if not full:
+            reviews = rankings.exclude(reviews=F("product__reviews_count"))
+        changed = set(reviews.values_list("pk", flat=True))
+        reviews.update(
+            reviews=Subquery(
+                Product.objects.filter(pk=OuterRef("pk")).values("reviews_count")
+            )
+        )
+
+        lines = CountProductInOrder.objects.all()
+        if full:
+            rankings.update(orders=0)
+        else:
+            lines = lines.filter(pk__gt=state.last_order_line)
+        last_line = lines.aggregate(last=Max("pk"))["last"]
+        totals = lines.order_by().values_list("product").annotate(total=Sum("count"))
+        for pk, total in totals:
+            rankings.filter(pk=pk).update(orders=F("orders") + total)
+            changed.add(pk)
+
+        # сначала товары без просмотров: у них меняются только отзывы и заказы,
+        # и повторно в следующий UPDATE они не попадают
+        no_views = rankings.filter(views=0, new_views=0)
+        if full:
+            no_views.update(score=score(F("reviews"), F("orders"), 0))
+        else:
+            changed = sorted(changed)
+            for start in range(0, len(changed), BATCH_SIZE):
+                no_views.filter(pk__in=changed[start : start + BATCH_SIZE]).update(
+                    score=score(F("reviews"), F("orders"), 0)
+                )
+
+        views = F("views") * decay + F("new_views")
+        views = Case(
+            When(LessThan(views, MIN_VIEWS), then=Value(0.0)),
+            default=views,
+            output_field=FloatField(),
+        )
+        # в UPDATE справа используются значения до обновления
+        rankings.filter(Q(views__gt=0) | Q(new_views__gt=0)).update(
+            views=views,
+            new_views=0,
+            score=score(F("reviews"), F("orders"), views),
+        )
+
+        state.refreshed_at = now
+        if full or last_line:
+            state.last_order_line = last_line or 0
+        state.save()
+
+
+def top_product_ids(limit):
+    """
+    id активных товаров с наибольшим рейтингом, по индексу на score.
+    Строки с нулевым score (ещё не пересчитанные) не учитываются.
+    """
+    rankings = ProductRanking.objects.filter(product__active=True, score__gt=0)
+    return list(rankings.order_by("-score").values_list("pk", flat=True)[:limit])
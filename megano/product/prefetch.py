@@ -0,0 +1,93 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework import serializers
+
+
+def is_single_valued(model, path):
+    """Путь из прямых ForeignKey/OneToOne, который можно взять JOIN-ом"""
+    for name in path.split(LOOKUP_SEP):
+        field = model._meta.get_field(name)
+        if not field.is_relation or not (field.many_to_one or field.one_to_one):
+            return False
+        if not field.concrete:
+            return False
+        model = field.related_model
+    return True
+
+
+def get_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def plan_queryset(serializer, queryset):
+    """
+    Добавляет к queryset select_related/prefetch_related для всех связей,
+    которые читает serializer: вложенные сериализаторы (рекурсивно, через
+    Prefetch с их собственным планом), связанные поля и связи, объявленные
+    в prefetch_hints для SerializerMethodField и полей-методов модели.
+    """
+    model = queryset.model
+    hints = getattr(serializer, "prefetch_hints", {})
+    select, prefetch = set(), []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        paths = hints.get(name, ())
+        if isinstance(paths, str):
+            paths = [paths]
+        for path in paths:
+            if is_single_valued(model, path):
+                select.add(path)
+            else:
+                prefetch.append(path)
+
+        source = field.source
+        if source == "*" or "." in source or name in hints:
+            continue
+        relation = get_relation(model, source)
+        if relation is None:
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.BaseSerializer):
+            related = relation.related_model._default_manager.all()
+            prefetch.append(Prefetch(source, queryset=setup_queryset(nested, related)))
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(source)
+        elif not isinstance(field, serializers.PrimaryKeyRelatedField):
+            # StringRelatedField и т.п. читают сам объект, а не только *_id
+            if is_single_valued(model, source):
+                select.add(source)
+            else:
+                prefetch.append(source)
+
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def setup_queryset(serializer, queryset):
+    if isinstance(serializer, PrefetchPlannerMixin):
+        return serializer.setup_queryset(queryset)
+    return plan_queryset(serializer, queryset)
+
+
+class PrefetchPlannerMixin:
+    """
+    Сериализатор сам готовит queryset под свои поля:
+    Serializer.setup_queryset(queryset) выполняется за постоянное число
+    запросов независимо от числа объектов. Поля, которые читают связи
+    неявно (методы), перечисляются в prefetch_hints: {поле: путь или список}.
+    """
+
+    prefetch_hints = {}
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        return plan_queryset(cls(), queryset)
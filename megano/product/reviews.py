@@ -0,0 +1,64 @@
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models import Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+
+RATING_FIELDS = {rate: f"rating_{rate}" for rate in range(1, 6)}
+
+
+def rating_condition(rate):
+    """Оценки вне шкалы учитываются в крайних столбцах гистограммы"""
+    if rate == 1:
+        return Q(rate__lte=1)
+    if rate == 5:
+        return Q(rate__gte=5)
+    return Q(rate=rate)
+
+
+def average_rating(rating_sum, reviews_count):
+    return Round(Cast(rating_sum, FloatField()) / reviews_count, 2)
+
+
+def apply_review(products, rate, sign=1):
+    """
+    Добавляет (sign=1) или убирает (sign=-1) оценку из агрегатов товаров
+    одним UPDATE, без чтения отзывов
+    """
+    field = RATING_FIELDS[min(max(rate, 1), 5)]
+    reviews_count = F("reviews_count") + sign
+    rating_sum = F("rating_sum") + sign * rate
+    return products.update(
+        reviews_count=reviews_count,
+        rating_sum=rating_sum,
+        rating=Case(
+            # условие вычисляется по значению до обновления
+            When(reviews_count__lte=-sign, then=Value(0)),
+            default=average_rating(rating_sum, reviews_count),
+            output_field=FloatField(),
+        ),
+        **{field: F(field) + sign},
+    )
+
+
+def rebuild_review_stats(products, reviews):
+    """Пересчитывает агрегаты по всем отзывам для товаров из products"""
+    reviews = reviews.filter(product_id=OuterRef("pk")).order_by().values("product")
+
+    def aggregate(expression):
+        subquery = reviews.annotate(value=expression).values("value")
+        return Coalesce(Subquery(subquery), 0)
+
+    products.update(
+        reviews_count=aggregate(Count("pk")),
+        rating_sum=aggregate(Sum("rate")),
+        **{
+            field: aggregate(Count("pk", filter=rating_condition(rate)))
+            for rate, field in RATING_FIELDS.items()
+        },
+    )
+    return products.update(
+        rating=Case(
+            When(reviews_count=0, then=Value(0)),
+            default=average_rating(F("rating_sum"), F("reviews_count")),
+            output_field=FloatField(),
+        )
+    )
@@ -0,0 +1,144 @@
+import re
+
+from django.db import models
+from django.db.models import Lookup
+
+FTS_TABLE = "product_fts"
+
+# Текст документа товара: заголовок, описания и названия тегов одной строкой
+TAG_NAMES_SQL = """
+    SELECT group_concat(t.name, ' ') FROM product_tag t
+    INNER JOIN product_tag_product tp ON tp.tag_id = t.id
+    WHERE tp.product_id = {product_id}
+"""
+
+INDEX_PRODUCT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, fullDescription, tags)
+    SELECT p.id, p.title, p.description, p.fullDescription,
+        coalesce(({TAG_NAMES_SQL.format(product_id="p.id")}), '')
+    FROM product_product p WHERE p.id = {{product_id}};
+"""
+
+UNINDEX_PRODUCT_SQL = f"DELETE FROM {FTS_TABLE} WHERE rowid = {{product_id}};"
+
+REINDEX_PRODUCT_SQL = UNINDEX_PRODUCT_SQL + INDEX_PRODUCT_SQL
+
+# Триггеры ссылаются на product_product, поэтому миграции, которые
+# пересоздают эту таблицу в SQLite (AddField, AlterField), должны удалять их
+# до изменения схемы и создавать заново после (drop/create_search_triggers)
+TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER product_fts_insert AFTER INSERT ON product_product BEGIN
+        {INDEX_PRODUCT_SQL.format(product_id="new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER product_fts_update
+    AFTER UPDATE OF title, description, fullDescription ON product_product BEGIN
+        {REINDEX_PRODUCT_SQL.format(product_id="new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER product_fts_delete AFTER DELETE ON product_product BEGIN
+        {UNINDEX_PRODUCT_SQL.format(product_id="old.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER product_fts_tag_add AFTER INSERT ON product_tag_product BEGIN
+        {REINDEX_PRODUCT_SQL.format(product_id="new.product_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER product_fts_tag_remove AFTER DELETE ON product_tag_product BEGIN
+        {REINDEX_PRODUCT_SQL.format(product_id="old.product_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER product_fts_tag_rename AFTER UPDATE OF name ON product_tag BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (
+            SELECT product_id FROM product_tag_product WHERE tag_id = new.id
+        );
+        INSERT INTO {FTS_TABLE} (rowid, title, description, fullDescription, tags)
+        SELECT p.id, p.title, p.description, p.fullDescription,
+            coalesce(({TAG_NAMES_SQL.format(product_id="p.id")}), '')
+        FROM product_product p WHERE p.id IN (
+            SELECT product_id FROM product_tag_product WHERE tag_id = new.id
+        );
+    END
+    """,
+]
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, fullDescription, tags,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, fullDescription, tags)
+    SELECT p.id, p.title, p.description, p.fullDescription,
+        coalesce(({TAG_NAMES_SQL.format(product_id="p.id")}), '')
+    FROM product_product p
+    """,
+    *TRIGGERS_SQL,
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS product_fts_tag_rename",
+    "DROP TRIGGER IF EXISTS product_fts_tag_remove",
+    "DROP TRIGGER IF EXISTS product_fts_tag_add",
+    "DROP TRIGGER IF EXISTS product_fts_delete",
+    "DROP TRIGGER IF EXISTS product_fts_update",
+    "DROP TRIGGER IF EXISTS product_fts_insert",
+]
+
+DROP_SQL = [*DROP_TRIGGERS_SQL, f"DROP TABLE IF EXISTS {FTS_TABLE}"]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский ввод в безопасное выражение FTS5:
+    каждое слово берётся в кавычки и ищется по префиксу ("mac"* "pro"*)
+    """
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchDocumentField(models.TextField):
+    """Скрытый столбец FTS5 с именем таблицы, по которому делается MATCH"""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
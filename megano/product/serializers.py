@@ -1,5 +1,9 @@
 import datetime
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import serializers
+
+from .prefetch import PrefetchPlannerMixin
 from .models import (
     Product,
     Tag,
@@ -18,21 +22,16 @@ class CategoryIconSerializer(serializers.ModelSerializer):
         fields = "id", "src", "alt"
 
 
-class SubCategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = "__all__"
-
-    image = CategoryIconSerializer(many=False, read_only=True)
-
-
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = "__all__"
+        exclude = "lft", "rght", "tree_id", "level"
 
     image = CategoryIconSerializer(many=False, required=False)
-    subcategories = SubCategorySerializer(many=True, required=False)
+    subcategories = serializers.SerializerMethodField()
+
+    def get_subcategories(self, instance):
+        return CategorySerializer(instance.get_children(), many=True).data
 
 
 class ProductSpecificationSerializer(serializers.ModelSerializer):
@@ -59,13 +58,17 @@ class TagsProductSerializer(serializers.ModelSerializer):
         fields = "id", "name"
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(PrefetchPlannerMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = "__all__"
 
+    prefetch_hints = {"images": "images"}
+
     images = serializers.SerializerMethodField()
-    reviews = ReviewSerializer(many=True, required=False)
+    # последние отзывы, все - постранично в /api/product/<pk>/reviews
+    reviews = serializers.SerializerMethodField()
+    reviewsCount = serializers.IntegerField(source="reviews_count", read_only=True)
     tags = TagsProductSerializer(many=True, required=False)
     specifications = ProductSpecificationSerializer(many=True, required=False)
     price = serializers.SerializerMethodField()
@@ -77,20 +80,88 @@ class ProductSerializer(serializers.ModelSerializer):
             images.append({"src": f"/media/{image.__str__()}", "alt": image.name})
         return images
 
+    @classmethod
+    def setup_queryset(cls, queryset):
+        latest = Review.objects.order_by("-date", "-pk")
+        latest = latest[: settings.PRODUCT_LATEST_REVIEWS]
+        return (
+            super()
+            .setup_queryset(queryset)
+            .with_effective_price()
+            .prefetch_related(
+                Prefetch("reviews", queryset=latest, to_attr="latest_reviews")
+            )
+        )
+
+    def get_reviews(self, instance):
+        reviews = getattr(instance, "latest_reviews", None)
+        if reviews is None:
+            reviews = instance.reviews.order_by("-date", "-pk")
+            reviews = reviews[: settings.PRODUCT_LATEST_REVIEWS]
+        return ReviewSerializer(reviews, many=True).data
+
     def get_price(self, instance):
-        salePrice = instance.sales.first()
-        if salePrice:
-            instance.price = salePrice.salePrice
-            instance.save()
-            return salePrice.salePrice
-        return instance.price
+        # списки товаров приходят с аннотацией, одиночный товар дочитывается
+        if not hasattr(instance, "effective_price"):
+            instance.effective_price = (
+                Product.objects.with_effective_price()
+                .values_list("effective_price", flat=True)
+                .get(pk=instance.pk)
+            )
+        return instance.effective_price
+
 
+class ProductShortSerializer(PrefetchPlannerMixin, serializers.ModelSerializer):
+    """Карточка товара для списков"""
 
-class SaleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = (
+            "id",
+            "category",
+            "price",
+            "count",
+            "date",
+            "title",
+            "description",
+            "freeDelivery",
+            "images",
+            "tags",
+            "reviews",
+            "rating",
+        )
+
+    images = serializers.SerializerMethodField()
+    tags = TagsProductSerializer(many=True, required=False)
+    reviews = serializers.IntegerField(source="reviews_count", read_only=True)
+    price = serializers.SerializerMethodField()
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        # только столбцы карточки вместо плана по всем полям
+        return queryset.with_effective_price().cards()
+
+    def get_images(self, instance):
+        images = []
+        for image in instance.images.all():
+            images.append({"src": f"/media/{image.__str__()}", "alt": image.name})
+        return images
+
+    def get_price(self, instance):
+        return instance.effective_price
+
+
+class SaleSerializer(PrefetchPlannerMixin, serializers.ModelSerializer):
     class Meta:
         model = Sale
         fields = "__all__"
 
+    prefetch_hints = {
+        "images": "product__images",
+        "title": "product",
+        "href": "product",
+    }
+
     images = serializers.SerializerMethodField()
     title = serializers.StringRelatedField()
     href = serializers.StringRelatedField()
@@ -0,0 +1,306 @@
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import cache
+from .documents import invalidate_documents
+from .index import get_built_catalog_index
+from .suggest import get_built_suggest_index
+from .models import (
+    Product,
+    Category,
+    CategoryIcon,
+    Tag,
+    Sale,
+    Review,
+    ProductImage,
+    ProductSpecification,
+)
+from .reviews import apply_review
+
+
+def update_index_on_commit(update):
+    # индекс в памяти меняется после коммита: откат не оставит в нём товаров
+    index = get_built_catalog_index()
+    if index:
+        transaction.on_commit(lambda: update(index))
+
+
+def update_suggest_on_commit(update):
+    index = get_built_suggest_index()
+    if index:
+        transaction.on_commit(lambda: update(index))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance: Product, **kwargs):
+    pk = instance.pk
+    # цена в индексе учитывает распродажи, поэтому строка перечитывается
+    update_index_on_commit(lambda index: index.refresh(pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance: Product, **kwargs):
+    pk = instance.pk
+    update_index_on_commit(lambda index: index.remove(pk))
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def reindex_sale_product(sender, instance: Sale, **kwargs):
+    product_id = instance.product_id
+    update_index_on_commit(lambda index: index.refresh(product_id))
+
+
+@receiver(m2m_changed, sender=Tag.product.through)
+def index_tag_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    pk, pk_set = instance.pk, set(pk_set or ())
+
+    def update(index):
+        if reverse:
+            # instance - товар, pk_set - id тегов
+            tag_ids = list(index.by_tag) if action == "post_clear" else pk_set
+            for tag_id in tag_ids:
+                if action == "post_add":
+                    index.tag(tag_id, [pk])
+                else:
+                    index.untag(tag_id, [pk])
+        elif action == "post_add":
+            index.tag(pk, pk_set)
+        elif action == "post_remove":
+            index.untag(pk, pk_set)
+        else:
+            index.untag(pk)
+
+    update_index_on_commit(update)
+
+
+@receiver(post_delete, sender=Tag)
+def unindex_tag(sender, instance: Tag, **kwargs):
+    pk = instance.pk
+    update_index_on_commit(lambda index: index.untag(pk))
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance: Category, **kwargs):
+    pk, parent_id = instance.pk, instance.parent_id
+    update_index_on_commit(lambda index: index.set_parent(pk, parent_id))
+
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance: Category, **kwargs):
+    pk = instance.pk
+    update_index_on_commit(lambda index: index.set_parent(pk, None))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rate(sender, instance: Review, raw=False, **kwargs):
+    instance._saved_rate = None
+    if instance.pk and not raw:
+        instance._saved_rate = (
+            Review.objects.filter(pk=instance.pk)
+            .values_list("product_id", "rate")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance: Review, created, raw=False, **kwargs):
+    if raw:
+        return
+    saved = getattr(instance, "_saved_rate", None)
+    if saved == (instance.product_id, instance.rate):
+        return
+    if saved:
+        product_id, rate = saved
+        apply_review(Product.objects.filter(pk=product_id), rate, -1)
+    apply_review(Product.objects.filter(pk=instance.product_id), instance.rate)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance: Review, **kwargs):
+    apply_review(Product.objects.filter(pk=instance.product_id), instance.rate, -1)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance: Product, **kwargs):
+    instance._saved_category_id = (
+        Product.objects.filter(pk=instance.pk).values_list("category_id").first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_pages(sender, instance: Product, **kwargs):
+    saved = getattr(instance, "_saved_category_id", None)
+    cache.invalidate_categories([instance.category_id, saved and saved[0]])
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_related_product_pages(sender, instance, **kwargs):
+    cache.invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_pages(sender, instance: Tag, **kwargs):
+    cache.invalidate_tags([instance.pk])
+
+
+@receiver(m2m_changed, sender=Tag.product.through)
+def invalidate_tagged_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # после очистки связей уже не узнать, каких товаров она коснулась
+        pk_set = set(
+            instance.tags.values_list("pk", flat=True)
+            if reverse
+            else instance.product.values_list("pk", flat=True)
+        )
+    elif action not in ("post_add", "post_remove"):
+        return
+    tag_ids, product_ids = (
+        (pk_set, [instance.pk]) if reverse else ([instance.pk], pk_set)
+    )
+    cache.bump_versions_on_commit([cache.tag_scope(pk) for pk in tag_ids])
+    cache.invalidate_products(product_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_pages(sender, instance: Category, **kwargs):
+    cache.invalidate_all()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def suggest_product(sender, instance: Product, **kwargs):
+    pk = instance.pk
+    saved = getattr(instance, "_saved_category_id", None)
+    category_ids = {instance.category_id, saved and saved[0]} - {None}
+
+    def update(index):
+        index.refresh_product(pk)
+        for category_id in category_ids:
+            index.refresh_category(category_id)
+
+    update_suggest_on_commit(update)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def suggest_reviewed_product(sender, instance: Review, **kwargs):
+    pk = instance.product_id
+    update_suggest_on_commit(lambda index: index.refresh_product(pk))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def suggest_category(sender, instance: Category, **kwargs):
+    pk = instance.pk
+    update_suggest_on_commit(lambda index: index.refresh_category(pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def suggest_tag(sender, instance: Tag, **kwargs):
+    pk = instance.pk
+    update_suggest_on_commit(lambda index: index.refresh_tag(pk))
+
+
+@receiver(m2m_changed, sender=Tag.product.through)
+def suggest_tagged(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        pk = instance.pk
+        update_suggest_on_commit(lambda index: index.refresh_tag(pk))
+        return
+    # после очистки неизвестно, какие теги были у товара
+    tag_ids = set(pk_set) if action != "post_clear" else None
+
+    def update(index):
+        for tag_id in tag_ids if tag_ids is not None else index.tag_ids():
+            index.refresh_tag(tag_id)
+
+    update_suggest_on_commit(update)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_document(sender, instance: Product, raw=False, **kwargs):
+    if not raw:
+        invalidate_documents([instance.pk])
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=ProductSpecification)
+def invalidate_related_document(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_documents([instance.product_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tagged_documents(sender, instance: Tag, raw=False, **kwargs):
+    if not raw:
+        invalidate_documents(instance.product.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Tag.product.through)
+def invalidate_retagged_documents(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # изменились теги одного товара
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_documents([instance.pk])
+    elif action == "pre_clear":
+        invalidate_documents(instance.product.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        invalidate_documents(pk_set)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryIcon)
+@receiver(post_delete, sender=CategoryIcon)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_model_version(sender, instance, **kwargs):
+    # версии моделей входят в ETag списков (product.conditional)
+    # и в ключ кэша дерева категорий; до коммита новый ETag достался бы
+    # старому содержимому
+    cache.bump_versions_on_commit([cache.model_scope(sender)])
+
+
+@receiver(m2m_changed, sender=Tag.product.through)
+def bump_tagged_version(sender, action, **kwargs):
+    # теги входят в карточки товаров
+    if action in ("post_add", "post_remove", "post_clear"):
+        cache.bump_versions_on_commit([cache.model_scope(Product)])
@@ -0,0 +1,43 @@
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+CHUNK_SIZE = 500
+
+
+def stream_list(queryset, serializer_class, context=None, chunk_size=CHUNK_SIZE):
+    """
+    Генератор JSON-массива по частям: queryset читается через iterator()
+    (prefetch_related выполняется на каждую пачку), каждая пачка
+    сериализуется и кодируется отдельно и сразу отдаётся наружу
+    """
+    renderer = JSONRenderer()
+    instances = queryset.iterator(chunk_size=chunk_size)
+    separator = b"["
+    while chunk := list(islice(instances, chunk_size)):
+        data = serializer_class(chunk, many=True, context=context).data
+        # из "[...]" пачки остаются только элементы
+        yield separator + renderer.render(data)[1:-1]
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def streaming_list_response(
+    queryset, serializer_class, key=None, context=None, chunk_size=CHUNK_SIZE
+):
+    """
+    Ответ с тем же JSON, что Response(serializer.data) или
+    Response({key: serializer.data}), но без сборки всего списка в памяти
+    """
+    content = stream_list(queryset, serializer_class, context, chunk_size)
+    if key is not None:
+        content = wrap(content, key)
+    return StreamingHttpResponse(content, content_type="application/json")
+
+
+def wrap(content, key):
+    # ключ уходит вместе с первой пачкой, а не отдельным маленьким куском
+    yield b"{" + JSONRenderer().render(key) + b":" + next(content)
+    yield from content
+    yield b"}"
@@ -0,0 +1,220 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.db.models import Count, F, Q
+
+from .index import is_stale
+from .models import Product, Category, Tag
+
+SUGGEST_LIMIT = 10
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().replace("ё", "е").split())
+
+
+def title_keys(normalized):
+    """Ключи для поиска с начала названия и с начала каждого слова в нём"""
+    words = normalized.split(" ")
+    return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class SuggestIndex:
+    """
+    Индекс подсказок поисковой строки: отсортированный массив ключей
+    (нормализованное название или его хвост с начала слова) для поиска
+    по префиксу через bisect. Совпадения ранжируются по популярности:
+    у товара это число отзывов, у категории и тега - число товаров.
+    Для коротких префиксов, под которые попадает большая часть словаря,
+    вместо сортировки совпадений просматривается список записей в порядке
+    популярности до первых limit подходящих.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built_at = 0.0
+        # изменения, пришедшие во время перестройки, повторяются после неё
+        self.journal = None
+        self.keys = []
+        self.ranked = []
+        self.entries = {}
+
+    def build(self):
+        """
+        Читает базу и собирает новый словарь без блокировки, подсказки в это
+        время идут по старому; затем данные подменяются целиком
+        """
+        with self.lock:
+            self.journal = []
+        try:
+            data = self.load()
+        except Exception:
+            with self.lock:
+                self.journal = None
+            raise
+        with self.lock:
+            journal, self.journal = self.journal, None
+            self.__dict__.update(data)
+            self.built_at = time.monotonic()
+        for method, args in journal:
+            getattr(self, method)(*args)
+
+    def record(self, method, *args):
+        if self.journal is not None:
+            self.journal.append((method, args))
+
+    def load(self):
+        products = Product.objects.filter(active=True).annotate(
+            popularity=F("reviews_count")
+        )
+        categories = Category.objects.filter(active=True).annotate(
+            popularity=Count("products", filter=Q(products__active=True))
+        )
+        tags = Tag.objects.annotate(
+            popularity=Count("product", filter=Q(product__active=True))
+        )
+        entries = {}
+        for kind, queryset, field in (
+            ("product", products, "title"),
+            ("category", categories, "title"),
+            ("tag", tags, "name"),
+        ):
+            for pk, title, popularity in queryset.values_list(
+                "pk", field, "popularity"
+            ):
+                entries[kind, pk] = (title, normalize(title), popularity)
+        keys = sorted(
+            (key, kind, pk)
+            for (kind, pk), (_, normalized, _) in entries.items()
+            for key in title_keys(normalized)
+        )
+        ranked = sorted(
+            (-popularity, pk, kind)
+            for (kind, pk), (_, _, popularity) in entries.items()
+        )
+        return {"entries": entries, "keys": keys, "ranked": ranked}
+
+    def add(self, kind, pk, title, popularity):
+        with self.lock:
+            self.record("add", kind, pk, title, popularity)
+            self.discard(kind, pk)
+            normalized = normalize(title)
+            self.entries[kind, pk] = (title, normalized, popularity)
+            for key in title_keys(normalized):
+                insort(self.keys, (key, kind, pk))
+            insort(self.ranked, (-popularity, pk, kind))
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self.record("remove", kind, pk)
+            self.discard(kind, pk)
+
+    def discard(self, kind, pk):
+        with self.lock:
+            entry = self.entries.pop((kind, pk), None)
+            if entry is None:
+                return
+            _, normalized, popularity = entry
+            for key in title_keys(normalized):
+                del self.keys[bisect_left(self.keys, (key, kind, pk))]
+            del self.ranked[bisect_left(self.ranked, (-popularity, pk, kind))]
+
+    def refresh_product(self, pk):
+        row = (
+            Product.objects.filter(pk=pk, active=True)
+            .annotate(popularity=F("reviews_count"))
+            .values_list("title", "popularity")
+            .first()
+        )
+        if row is None:
+            self.remove("product", pk)
+        else:
+            self.add("product", pk, *row)
+
+    def refresh_category(self, pk):
+        row = (
+            Category.objects.filter(pk=pk, active=True)
+            .annotate(popularity=Count("products", filter=Q(products__active=True)))
+            .values_list("title", "popularity")
+            .first()
+        )
+        if row is None:
+            self.remove("category", pk)
+        else:
+            self.add("category", pk, *row)
+
+    def refresh_tag(self, pk):
+        row = (
+            Tag.objects.filter(pk=pk)
+            .annotate(popularity=Count("product", filter=Q(product__active=True)))
+            .values_list("name", "popularity")
+            .first()
+        )
+        if row is None:
+            self.remove("tag", pk)
+        else:
+            self.add("tag", pk, *row)
+
+    def tag_ids(self):
+        with self.lock:
+            return [pk for kind, pk in self.entries if kind == "tag"]
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """Список (тип, id, название) с наибольшей популярностью"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self.lock:
+            start = bisect_left(self.keys, (prefix,))
+            stop = bisect_left(self.keys, (prefix + "\uffff",), start)
+            # просмотр по популярности найдёт limit совпадений примерно за
+            # limit * len(keys) / (stop - start) шагов, выбираем путь короче
+            if (stop - start) ** 2 > limit * len(self.keys):
+                best = self.scan_ranked(prefix, limit)
+            else:
+                # одна запись может совпасть по нескольким словам названия
+                found = {(kind, pk) for _, kind, pk in self.keys[start:stop]}
+                ranks = ((-self.entries[item][2], item[1], item[0]) for item in found)
+                best = [(kind, pk) for _, pk, kind in heapq.nsmallest(limit, ranks)]
+            return [(kind, pk, self.entries[kind, pk][0]) for kind, pk in best]
+
+    def scan_ranked(self, prefix, limit):
+        best = []
+        word = " " + prefix
+        for _, pk, kind in self.ranked:
+            normalized = self.entries[kind, pk][1]
+            if normalized.startswith(prefix) or word in normalized:
+                best.append((kind, pk))
+                if len(best) == limit:
+                    break
+        return best
+
+
+_suggest_index = SuggestIndex()
+_build_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """
+    Индекс подсказок. Строится лениво при первом обращении в процессе и
+    перестраивается через CATALOG_INDEX_MAX_AGE секунд, как и индекс каталога:
+    перестраивает один поток, остальные тем временем ищут по прежним данным.
+    """
+    if is_stale(_suggest_index):
+        # первую сборку ждут все, перестройку - только тот, кто её начал
+        if _build_lock.acquire(blocking=not _suggest_index.built_at):
+            try:
+                if is_stale(_suggest_index):
+                    _suggest_index.build()
+            finally:
+                _build_lock.release()
+    return _suggest_index
+
+
+def get_built_suggest_index():
+    """Индекс для инкрементального обновления: None, если он ещё не строился"""
+    if _suggest_index.built_at:
+        return _suggest_index
+    return None
@@ -1,3 +1,1104 @@
-from django.test import TestCase
+import datetime
+import io
+import itertools
+import json
+import re
+from base64 import urlsafe_b64encode
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import cache as catalog_cache
+from .filters import CatalogFilter
+from .index import get_catalog_index
+from .models import (
+    Product,
+    ProductSearchIndex,
+    Category,
+    Tag,
+    Review,
+    Sale,
+    ProductImage,
+    ProductSpecification,
+    ProductDocument,
+    ProductRanking,
+    RankingState,
+    REVIEW_STATS_FIELDS,
+)
+from . import popularity
+from .search import build_match_query
+from .serializers import SaleSerializer
+from .streaming import stream_list
+from .views import SORT_FIELDS, sort_products
+from .suggest import SuggestIndex, get_suggest_index
+
+
+class CatalogFilterQueryPlanTestCase(TestCase):
+    """Ни одна комбинация фильтров каталога не должна сканировать product_product"""
+
+    full_scan = re.compile(r"\bSCAN product_product\b(?! USING)")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="Laptops", active=True)
+        Category.objects.create(title="Gaming", active=True, parent=cls.category)
+        cls.tag = Tag.objects.create(name="Gaming")
+        product = Product.objects.create(
+            title="Laptop", price=100, count=5, active=True, category=cls.category
+        )
+        cls.tag.product.add(product)
+
+    def test_filters_use_indexes(self):
+        options = {
+            "category": [None, self.category.pk],
+            "minPrice": [None, 10],
+            "maxPrice": [None, 1000],
+            "available": [None, "true"],
+            "freeDelivery": [None, "true"],
+            "tags": [[], [self.tag.pk]],
+            "name": [None, "lap"],
+        }
+        # планы с сортировкой, которую строит каталог, по каждому из полей
+        orderings = [
+            {"sort": sort, "sortType": sort_type}
+            for sort in [None, *SORT_FIELDS]
+            for sort_type in ["inc", "dec"]
+        ]
+        factory = RequestFactory()
+        for values in itertools.product(*options.values()):
+            data = dict(zip(options, values))
+            for ordering in orderings:
+                request = factory.get("/", {k: v for k, v in ordering.items() if v})
+                with self.subTest(**data, **ordering):
+                    products = sort_products(request, CatalogFilter(data).qs)
+                    plan = products.explain()
+                    self.assertIsNone(self.full_scan.search(plan), plan)
+
+
+class CategoryTreeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Category.objects.create(title="Electronics", active=True)
+        cls.child = Category.objects.create(
+            title="Computers", parent=cls.root, active=True
+        )
+        cls.leaf = Category.objects.create(
+            title="Laptops", parent=cls.child, active=True
+        )
+        Category.objects.create(title="Phones", active=True)
+        hidden = Category.objects.create(title="Hidden", parent=cls.root)
+        Category.objects.create(title="Under hidden", parent=hidden, active=True)
+        cls.product = Product.objects.create(
+            title="Laptop", price=100, count=1, active=True, category=cls.leaf
+        )
+
+    def test_catalog_filter_includes_whole_subtree(self):
+        for category in (self.root, self.child, self.leaf):
+            products = CatalogFilter({"category": category.pk}).qs
+            self.assertEqual(list(products), [self.product])
+
+    def test_categories_list_single_query(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("categories"))
+        roots = response.json()
+        self.assertEqual([root["title"] for root in roots], ["Electronics", "Phones"])
+        self.assertEqual(len(roots[0]["subcategories"]), 1)
+        laptops = roots[0]["subcategories"][0]["subcategories"][0]
+        self.assertEqual(laptops["title"], "Laptops")
+
+    def test_categories_list_cached(self):
+        cache.clear()
+        self.client.get(reverse("categories"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("categories"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leaf.title = "Notebooks"
+            self.leaf.save()
+        response = self.client.get(reverse("categories"))
+        laptops = response.json()[0]["subcategories"][0]["subcategories"][0]
+        self.assertEqual(laptops["title"], "Notebooks")
+
+
+class SuggestIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="Macs", active=True)
+        cls.air = Product.objects.create(
+            title="MacBook Air", active=True, category=cls.category
+        )
+        cls.pro = Product.objects.create(
+            title="Apple MacBook Pro", active=True, category=cls.category
+        )
+        Review.objects.create(product=cls.pro, author="a", email="a@a.a", rate=5)
+
+    def test_prefix_matches_ranked_by_popularity(self):
+        index = SuggestIndex()
+        index.build()
+        self.assertEqual(
+            index.suggest("  MAC"),
+            [
+                ("category", self.category.pk, "Macs"),
+                ("product", self.pro.pk, "Apple MacBook Pro"),
+                ("product", self.air.pk, "MacBook Air"),
+            ],
+        )
+        self.assertEqual(index.suggest("macbook a", limit=1)[0][1], self.air.pk)
+        self.assertEqual(index.suggest("acbook"), [])
+
+    def test_incremental_update(self):
+        index = SuggestIndex()
+        index.build()
+        index.add("product", self.air.pk, "iMac", 10)
+        self.assertEqual(index.suggest("imac")[0][1], self.air.pk)
+        self.assertEqual(len(index.suggest("macbook")), 1)
+        index.remove("product", self.air.pk)
+        self.assertEqual(index.suggest("imac"), [])
+
+    def test_inactive_categories_hidden(self):
+        Category.objects.create(title="Mac Pro", active=False)
+        index = SuggestIndex()
+        index.build()
+        titles = [title for kind, _, title in index.suggest("mac")]
+        self.assertNotIn("Mac Pro", titles)
+        self.category.active = False
+        self.category.save()
+        index.refresh_category(self.category.pk)
+        self.assertNotIn("category", [kind for kind, *_ in index.suggest("mac")])
+
+    def test_changes_during_build_are_kept(self):
+        index = SuggestIndex()
+        load = index.load
+
+        def load_and_change():
+            data = load()
+            # товар изменён, пока собирался снимок базы
+            Product.objects.filter(pk=self.air.pk).update(title="iMac")
+            index.refresh_product(self.air.pk)
+            return data
+
+        with mock.patch.object(index, "load", load_and_change):
+            index.build()
+        self.assertEqual(index.suggest("imac")[0][1], self.air.pk)
+
+    def test_signals_update_on_commit(self):
+        index = get_suggest_index()
+        index.build()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.air.title = "iMac"
+            self.air.save()
+            self.assertEqual(index.suggest("imac"), [])
+        self.assertTrue(callbacks)
+        self.assertEqual(index.suggest("imac")[0][1], self.air.pk)
+
+
+class EffectivePriceTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date.today()
+        cls.product = Product.objects.create(title="Phone", price=100, active=True)
+        Sale.objects.create(
+            product=cls.product, price=100, salePrice=80, dateFrom=today
+        )
+        Sale.objects.create(
+            product=cls.product,
+            price=100,
+            salePrice=50,
+            dateFrom=today - datetime.timedelta(days=10),
+            dateTo=today - datetime.timedelta(days=1),
+        )
+
+    def test_only_current_sales_apply(self):
+        product = Product.objects.with_effective_price().get(pk=self.product.pk)
+        self.assertEqual(product.effective_price, 80)
+        self.assertEqual(CatalogFilter({"maxPrice": 90}).qs.get(), self.product)
+        self.assertFalse(CatalogFilter({"minPrice": 90}).qs.exists())
+
+    def setUp(self):
+        # накопленные просмотры записываются пачкой, не в этом чтении
+        popularity.flush_views()
+
+    def test_reads_do_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("product_detail", kwargs={"pk": self.product.pk})
+            )
+        self.assertEqual(response.json()["price"], 80)
+        for query in queries.captured_queries:
+            self.assertTrue(query["sql"].startswith("SELECT"), query["sql"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 100)
+
+
+class ReviewStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(title="Phone", active=True)
+
+    def review(self, rate):
+        return Review.objects.create(
+            product=self.product, author="a", email="a@a.a", rate=rate
+        )
+
+    def assertStats(self, count, rating_sum, rating, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reviews_count, count)
+        self.assertEqual(self.product.rating_sum, rating_sum)
+        self.assertEqual(float(self.product.rating), rating)
+        self.assertEqual(
+            [getattr(self.product, f"rating_{rate}") for rate in range(1, 6)],
+            histogram,
+        )
+
+    def test_aggregates_follow_reviews(self):
+        five, two = self.review(5), self.review(2)
+        self.assertStats(2, 7, 3.5, [0, 1, 0, 0, 1])
+        two.rate = 4
+        two.save()
+        self.assertStats(2, 9, 4.5, [0, 0, 0, 1, 1])
+        five.delete()
+        self.assertStats(1, 4, 4.0, [0, 0, 0, 1, 0])
+        two.delete()
+        self.assertStats(0, 0, 0.0, [0, 0, 0, 0, 0])
+
+    def test_stale_product_save_keeps_aggregates(self):
+        product = Product.objects.get(pk=self.product.pk)
+        self.review(3)
+        product.title = "Smartphone"
+        product.save()
+        self.assertStats(1, 3, 3.0, [0, 0, 1, 0, 0])
+
+    def test_rebuild_command(self):
+        self.review(1)
+        self.review(5)
+        Product.objects.update(reviews_count=0, rating_sum=0, rating=0, rating_1=7)
+        call_command("rebuild_review_stats", stdout=io.StringIO())
+        self.assertStats(2, 6, 3.0, [1, 0, 0, 0, 1])
+
+    def test_not_editable_in_admin(self):
+        # значения из формы всё равно не сохранились бы: save() их исключает
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(admin)
+        url = reverse("admin:product_product_change", args=[self.product.pk])
+        form = self.client.get(url).context["adminform"].form
+        self.assertFalse(REVIEW_STATS_FIELDS & set(form.fields))
+
+
+def create_products(count, category, tag):
+    """Товары со всеми связями, которые выводят сериализаторы"""
+    today = datetime.date.today()
+    products = []
+    for i in range(count):
+        product = Product.objects.create(
+            title=f"Product {i}",
+            price=100,
+            active=True,
+            limited_edition=True,
+            category=category,
+        )
+        ProductImage.objects.create(product=product, name="img", image="img.png")
+        ProductSpecification.objects.create(product=product, name="n", value="v")
+        Review.objects.create(product=product, author="a", email="a@a.a", rate=4)
+        Sale.objects.create(product=product, price=100, salePrice=90, dateFrom=today)
+        tag.product.add(product)
+        products.append(product)
+    return products
+
+
+class ProductQueryCountTestCase(TestCase):
+    """Число запросов эндпоинтов товаров не зависит от числа товаров"""
+
+    endpoints = {
+        "products_list": 4,
+        "popular": 5,
+        "limited": 3,
+        "banners": 4,
+        "sales": 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="Phones", favourite=True)
+        cls.tag = Tag.objects.create(name="New")
+        cls.product = create_products(1, cls.category, cls.tag)[0]
+
+    def setUp(self):
+        cache.clear()
+        # накопленные просмотры не должны сохраниться посреди подсчёта запросов
+        popularity.flush_views()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # потоковые ответы выполняют запросы по мере чтения
+        return json.loads(response.getvalue())
+
+    def assertConstantQueries(self, url, queries):
+        with self.assertNumQueries(queries):
+            self.get(url)
+        create_products(5, self.category, self.tag)
+        cache.clear()
+        with self.assertNumQueries(queries):
+            self.get(url)
+
+    def test_listings(self):
+        for name, queries in self.endpoints.items():
+            with self.subTest(name):
+                self.assertConstantQueries(reverse(name), queries)
+
+    @override_settings(PRODUCT_DOCUMENTS_BACKGROUND=False)
+    def test_product_detail(self):
+        url = reverse("product_detail", kwargs={"pk": self.product.pk})
+        for _ in range(2):
+            ProductDocument.objects.all().delete()
+            # промах: поиск документа и сериализация по плану запросов,
+            # документ сохраняется уже после ответа
+            with self.assertNumQueries(7):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            ProductImage.objects.create(product=self.product, image="2.png")
+            Review.objects.create(product=self.product, author="b", email="b@b.b")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+
+@override_settings(PRODUCT_DOCUMENTS_BACKGROUND=False)
+class ProductDocumentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="New")
+        cls.product = create_products(1, None, cls.tag)[0]
+        cls.url = reverse("product_detail", kwargs={"pk": cls.product.pk})
+
+    def setUp(self):
+        popularity.flush_views()
+
+    def get_stored(self):
+        # документ пересобирается после коммита запроса, который его не нашёл
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.url)
+
+    def test_served_from_store(self):
+        first = self.get_stored()
+        # время сборки документа для ETag и сам документ
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.json()["price"], 90)
+
+    def test_rebuilt_after_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, author="b", email="b@b.b")
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.json()["reviews"]), 2)
+
+    def test_expires_with_sale(self):
+        self.get_stored()
+        document = ProductDocument.objects.get(pk=self.product.pk)
+        self.assertIsNone(document.valid_until)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(
+                product=self.product, price=100, salePrice=70, dateFrom=tomorrow
+            )
+        document.refresh_from_db()
+        self.assertEqual(document.valid_until, tomorrow)
+
+    def test_miss_does_not_write(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+        self.assertEqual(response.json()["price"], 90)
+        self.assertFalse(response.has_header("ETag"))
+        for query in queries.captured_queries:
+            self.assertTrue(query["sql"].startswith("SELECT"), query["sql"])
+        self.assertFalse(ProductDocument.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ProductDocument.objects.get().body, response.content)
+
+    def test_missing_product(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(reverse("product_detail", kwargs={"pk": 999}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(callbacks, [])
+
+
+class StreamingListTestCase(TestCase):
+    def test_same_json_as_serializer(self):
+        tag = Tag.objects.create(name="New")
+        create_products(5, None, tag)
+        sales = SaleSerializer.setup_queryset(Sale.objects.order_by("pk"))
+        expected = {"items": SaleSerializer(sales, many=True).data}
+        for chunk_size in (1, 2, 100):
+            with self.subTest(chunk_size=chunk_size):
+                content = stream_list(sales, SaleSerializer, chunk_size=chunk_size)
+                body = b'{"items":' + b"".join(content) + b"}"
+                self.assertEqual(json.loads(body), json.loads(json.dumps(expected)))
+
+    def test_empty_list(self):
+        self.assertEqual(
+            b"".join(stream_list(Sale.objects.all(), SaleSerializer)), b"[]"
+        )
+
+
+@override_settings(PRODUCT_DOCUMENTS_BACKGROUND=False)
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="New")
+        cls.product = create_products(1, None, cls.tag)[0]
+
+    def setUp(self):
+        cache.clear()
+        # накопленные просмотры не должны сохраниться посреди подсчёта запросов
+        popularity.flush_views()
+
+    def test_list_not_modified(self):
+        url = reverse("tags_list")
+        response = self.client.get(url)
+        self.assertIn("max-age=300", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("max-age=300", response["Cache-Control"])
+
+    def test_list_etag_changes(self):
+        url = reverse("banners")
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            Sale.objects.create(
+                product=self.product,
+                price=100,
+                salePrice=50,
+                dateFrom=datetime.date.today(),
+            )
+        # до коммита ETag прежний: новое значение не достанется старым данным
+        self.assertEqual(self.client.get(url)["ETag"], etag)
+        for callback in callbacks:
+            callback()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_etag_after_cache_restart(self):
+        url = reverse("banners")
+        etag = self.client.get(url)["ETag"]
+        Sale.objects.create(
+            product=self.product,
+            price=100,
+            salePrice=50,
+            dateFrom=datetime.date.today(),
+        )
+        # версии моделей потеряны вместе с кэшем
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_not_modified(self):
+        url = reverse("product_detail", kwargs={"pk": self.product.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        response = self.client.get(url)
+        self.assertTrue(response.has_header("Last-Modified"))
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_etag_changes(self):
+        url = reverse("product_detail", kwargs={"pk": self.product.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, author="b", email="b@b.b")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(
+    POPULARITY_WEIGHTS={"reviews": 1, "orders": 2, "views": 0.5},
+    POPULARITY_VIEWS_HALF_LIFE=1,
+)
+class PopularityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="New")
+        cls.first, cls.second = create_products(2, None, cls.tag)
+
+    def setUp(self):
+        # просмотры, оставшиеся от других тестов, не учитываются
+        popularity.flush_views()
+        ProductRanking.objects.all().delete()
+
+    def test_ranking(self):
+        popularity.refresh()
+        for _ in range(4):
+            popularity.record_view(self.second.pk)
+        popularity.flush_views()
+        popularity.refresh()
+        self.assertEqual(popularity.top_product_ids(8), [self.second.pk, self.first.pk])
+        response = self.client.get(reverse("popular"))
+        self.assertEqual(
+            [item["id"] for item in response.json()],
+            [self.second.pk, self.first.pk],
+        )
+
+    def popular_ids(self):
+        return [item["id"] for item in self.client.get(reverse("popular")).json()]
+
+    def test_filled_by_reviews(self):
+        # просмотр до первого пересчёта создаёт строку рейтинга с нулевым score
+        popularity.record_view(self.first.pk)
+        popularity.flush_views()
+        self.assertEqual(self.popular_ids(), [self.second.pk, self.first.pk])
+
+        popularity.refresh()
+        new = Product.objects.create(title="New", active=True)
+        ids = self.popular_ids()
+        self.assertEqual(ids[-1], new.pk)
+        self.assertCountEqual(ids[:2], [self.first.pk, self.second.pk])
+
+    def shift_refresh(self, days):
+        state = RankingState.objects.get()
+        state.refreshed_at -= datetime.timedelta(days=days)
+        state.save()
+
+    def test_incremental_refresh(self):
+        popularity.refresh()
+        Review.objects.create(product=self.first, author="b", email="b@b.b", rate=5)
+        popularity.record_view(self.second.pk)
+        popularity.flush_views()
+        popularity.refresh()
+        first = ProductRanking.objects.get(pk=self.first.pk)
+        self.assertEqual((first.reviews, first.score), (2, 2))
+        self.assertEqual(ProductRanking.objects.get(pk=self.second.pk).score, 1.5)
+
+        # через сутки просмотры весят вдвое меньше
+        self.shift_refresh(days=1)
+        popularity.refresh()
+        second = ProductRanking.objects.get(pk=self.second.pk)
+        self.assertAlmostEqual(second.views, 0.5, places=4)
+        self.assertAlmostEqual(second.score, 1.25, places=4)
+
+
+class SalesListTestCase(TestCase):
+    def test_active_window_and_pages(self):
+        today = datetime.date.today()
+        day = datetime.timedelta(days=1)
+        products = create_products(3, None, Tag.objects.create(name="New"))
+        Sale.objects.create(
+            product=products[0], dateFrom=today - 2 * day, dateTo=today - day
+        )
+        Sale.objects.create(product=products[1], dateFrom=today + day)
+        Sale.objects.create(product=products[2], dateFrom=today - day, dateTo=today)
+        response = self.client.get(reverse("sales"), {"currentPage": 2, "limit": 2})
+        data = response.json()
+        self.assertEqual((data["currentPage"], data["lastPage"]), (2, 2))
+        # действуют три распродажи из create_products и последняя, новые первыми
+        self.assertEqual(len(data["items"]), 2)
+        self.assertEqual(data["items"][-1]["dateTo"], today.strftime("%d.%b"))
+
+
+class BatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="New")
+        cls.product = create_products(1, None, cls.tag)[0]
+
+    def batch(self, urls):
+        return self.client.post(
+            reverse("batch"), {"requests": urls}, content_type="application/json"
+        )
+
+    def test_same_bodies_as_separate_requests(self):
+        urls = ["/api/tags", "/api/products/limited/", "/api/sales/?currentPage=1"]
+        responses = self.batch(urls).json()["responses"]
+        self.assertEqual([response["url"] for response in responses], urls)
+        for url, response in zip(urls[1:], responses[1:]):
+            self.assertEqual(response["status"], 200)
+            self.assertEqual(response["body"], self.client.get(url).json())
+        self.assertEqual(responses[0]["body"], [{"id": self.tag.pk, "name": "New"}])
+
+    def test_statuses(self):
+        urls = ["/api/product/999/", "/api/batch", "https://example.com/api/tags/"]
+        responses = self.batch(urls).json()["responses"]
+        self.assertEqual(
+            [response["status"] for response in responses], [404, 404, 400]
+        )
+
+    @override_settings(API_BATCH_MAX_REQUESTS=2)
+    def test_max_requests(self):
+        self.assertEqual(self.batch(["/api/tags/"] * 3).status_code, 400)
+
+    def test_invalid_body(self):
+        for body in [["/api/tags/"], "/api/tags/", 5, None, {"requests": "/api/tags/"}]:
+            with self.subTest(body=body):
+                response = self.client.post(
+                    reverse("batch"), json.dumps(body), content_type="application/json"
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PRODUCT_DOCUMENTS_BACKGROUND=False, PRODUCT_LATEST_REVIEWS=3)
+class ProductReviewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_products(1, None, Tag.objects.create(name="New"))[0]
+        for i in range(5):
+            Review.objects.create(product=cls.product, author=f"r{i}", email="r@r.r")
+        cls.url = reverse("add_reviews", kwargs={"pk": cls.product.pk})
+
+    def test_detail_has_latest_reviews(self):
+        response = self.client.get(
+            reverse("product_detail", kwargs={"pk": self.product.pk})
+        )
+        data = response.json()
+        self.assertEqual(
+            [review["author"] for review in data["reviews"]], ["r4", "r3", "r2"]
+        )
+        self.assertEqual(data["reviews_count"], 6)
+        self.assertEqual(data["reviewsCount"], 6)
+
+    def test_pages_by_cursor(self):
+        authors = []
+        params = {"limit": 4}
+        while True:
+            with self.assertNumQueries(3):
+                data = self.client.get(self.url, params).json()
+            authors += [review["author"] for review in data["items"]]
+            if not data["nextCursor"]:
+                break
+            params["cursor"] = data["nextCursor"]
+        self.assertEqual(authors, ["r4", "r3", "r2", "r1", "r0", "a"])
+        self.assertEqual(data["lastPage"], 2)
+
+    def test_post_still_requires_login(self):
+        review = {"author": "b", "email": "b@example.com", "text": "t", "rate": 5}
+        post = lambda: self.client.post(self.url, review, "application/json")
+        self.assertEqual(post().status_code, 403)
+        user = User.objects.create_user("reviewer", password="secret")
+        self.client.force_login(user)
+        self.assertEqual(post().status_code, 200)
+        self.assertEqual(self.product.reviews.count(), 7)
+
+
+class CatalogPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        values = [(300, 4, 2), (100, 5, 0), (200, 4, 7), (100, 3, 2), (300, 0, 1)]
+        for i, (price, rating, reviews) in enumerate(values * 2):
+            product = Product.objects.create(
+                title=f"Product {i}", price=price, rating=rating, active=True
+            )
+            # одинаковые даты у пар товаров, порядок внутри пары - по id
+            Product.objects.filter(pk=product.pk).update(
+                reviews_count=reviews, date=now - datetime.timedelta(days=i // 2)
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, params):
+        return self.client.get(reverse("products_list"), params)
+
+    def ids(self, data):
+        return [item["id"] for item in data["items"]]
+
+    def walk(self, params):
+        ids, params = [], {**params, "limit": 3}
+        for page in itertools.count(1):
+            data = self.get(params).json()
+            ids += self.ids(data)
+            # номер страницы приходит в курсоре
+            self.assertEqual(data["currentPage"], page)
+            if not data["nextCursor"]:
+                return ids
+            params["cursor"] = data["nextCursor"]
+
+    def test_cursor_round_trip(self):
+        for sort, sort_type in itertools.product(SORT_FIELDS, ["inc", "dec"]):
+            with self.subTest(sort=sort, sortType=sort_type):
+                params = {"sort": sort, "sortType": sort_type}
+                expected = self.ids(self.get({**params, "limit": 100}).json())
+                self.assertEqual(len(expected), 10)
+                self.assertEqual(self.walk(params), expected)
+
+    def test_page_number_fallback(self):
+        params = {"sort": "price", "limit": 100}
+        expected = self.ids(self.get(params).json())
+        data = self.get({"sort": "price", "limit": 4, "currentPage": 2}).json()
+        self.assertEqual(self.ids(data), expected[4:8])
+        self.assertEqual((data["currentPage"], data["lastPage"]), (2, 3))
+        data = self.get({"sort": "price", "limit": 4, "currentPage": "x"}).json()
+        self.assertEqual(self.ids(data), expected[:4])
+
+    def test_forged_cursor(self):
+        def encode(position):
+            return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        cursors = [
+            "not a cursor",
+            encode({"price": 100}),
+            encode([100, 1]),
+            encode([2, 100]),
+            encode([2, "cheap", 1]),
+            encode([2, 100, "first"]),
+            encode([2, None, 1]),
+            encode([2, [100], 1]),
+            encode([0, 100, 1]),
+            encode(["2", 100, 1]),
+            encode([True, 100, 1]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.get({"sort": "price", "cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+        for cursor in [encode([2, "yesterday", 1]), encode([2, 1, 1])]:
+            response = self.get({"sort": "date", "cursor": cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class CatalogPageCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(title="Phones", active=True)
+        cls.laptops = Category.objects.create(title="Laptops", active=True)
+        cls.tags = [Tag.objects.create(name="New"), Tag.objects.create(name="Hit")]
+        cls.phone = create_products(1, cls.phones, cls.tags[0])[0]
+        cls.laptop = create_products(1, cls.laptops, cls.tags[1])[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, params):
+        response = self.client.get(reverse("products_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertCached(self, params, cached=True):
+        hits = catalog_cache.get_stats()["hits"]
+        self.get(params)
+        self.assertEqual(catalog_cache.get_stats()["hits"] - hits, int(cached))
+
+    def test_hit_after_miss(self):
+        tags = [tag.pk for tag in self.tags]
+        self.get({"tags[]": tags, "filter[minPrice]": "10.0"})
+        with self.assertNumQueries(0):
+            # тот же запрос в нормализованном виде
+            self.get({"tags[]": tags[::-1], "filter[minPrice]": "10"})
+        self.assertEqual(
+            catalog_cache.get_stats(), {"hits": 1, "misses": 1, "hitRate": 0.5}
+        )
+
+    def test_invalidated_by_scope(self):
+        phones, laptops = {"category": self.phones.pk}, {"category": self.laptops.pk}
+        self.get(phones)
+        self.get(laptops)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.phone.title = "Phone X"
+            self.phone.save()
+        # до коммита версии не меняются: страницы со старыми строками
+        # не сохраняются под новой версией
+        self.assertCached(phones)
+        for callback in callbacks:
+            callback()
+        self.assertCached(phones, cached=False)
+        self.assertCached(laptops)
+
+        self.get({"tags[]": [self.tags[1].pk]})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].product.add(self.laptop)
+        self.assertCached({"tags[]": [self.tags[1].pk]}, cached=False)
+        self.assertCached(phones)
+
+    def test_invalidated_by_image(self):
+        params = {"category": self.phones.pk}
+        self.get(params)
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.phone, image="2.png")
+        self.assertEqual(len(self.get(params)["items"][0]["images"]), 2)
+        self.get(params)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertEqual(len(self.get(params)["items"][0]["images"]), 1)
+
+    def test_key_includes_day(self):
+        params = {"category": self.phones.pk}
+        self.get(params)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        # цены зависят от распродаж, действующих в этот день
+        with mock.patch("product.cache.timezone.localdate", return_value=tomorrow):
+            self.assertCached(params, cached=False)
+
+    def test_stats_for_admins(self):
+        url = reverse("catalog_cache_stats")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        admin = User.objects.create_user("admin", password="secret", is_staff=True)
+        self.client.force_login(admin)
+        self.get({})
+        self.assertEqual(self.client.get(url).json()["misses"], 1)
+
+
+class SearchIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="Gaming")
+        # чехол создан раньше, но телефон релевантнее запросу "phone"
+        cls.case = Product.objects.create(
+            title="Leather case",
+            description="fits a phone",
+            fullDescription="brown leather, magnetic clasp, card slot",
+            active=True,
+            price=10,
+        )
+        cls.phone = Product.objects.create(
+            title="Phone", description="phone for calls", active=True, price=300
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name, **params):
+        response = self.client.get(
+            reverse("products_list"), {"filter[name]": name, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.json()["items"]]
+
+    def test_match_query_escaping(self):
+        self.assertEqual(
+            build_match_query('mac "pro" OR -air*'), '"mac"* "pro"* "OR"* "air"*'
+        )
+        self.assertEqual(build_match_query(None), "")
+        self.assertEqual(build_match_query(' ( " * '), "")
+
+    def test_punctuation_in_name(self):
+        for name in ['"', 'pho"', "phone AND (", "NEAR(phone", "*", "-phone", "a:b"]:
+            with self.subTest(name=name):
+                self.search(name)
+        self.assertEqual(self.search('"phone" -'), [self.phone.pk, self.case.pk])
+
+    def test_ranked_by_relevance(self):
+        self.assertEqual(self.search("phone"), [self.phone.pk, self.case.pk])
+        self.assertEqual(
+            self.search("phone", sort="price", sortType="dec"),
+            [self.case.pk, self.phone.pk],
+        )
+        self.assertEqual(self.search("leath"), [self.case.pk])
+
+    def test_renamed_product(self):
+        self.phone.title = "Smartphone"
+        self.phone.description = ""
+        self.phone.save()
+        self.assertEqual(self.search("smartph"), [self.phone.pk])
+        self.assertEqual(self.search("calls"), [])
+
+    def test_tags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.product.add(self.case)
+        self.assertEqual(self.search("gaming"), [self.case.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = "Outdoor"
+            self.tag.save()
+        self.assertEqual(self.search("gaming"), [])
+        self.assertEqual(self.search("outdoor"), [self.case.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.product.remove(self.case)
+        self.assertEqual(self.search("outdoor"), [])
+
+    def test_deleted_product(self):
+        self.case.delete()
+        self.assertFalse(ProductSearchIndex.objects.filter(pk=self.case.pk).exists())
+        self.assertEqual(self.search("phone"), [self.phone.pk])
+
+
+def create_catalog():
+    """Небольшой каталог: вложенные категории, теги, распродажа, разные флаги"""
+    laptops = Category.objects.create(title="Laptops", active=True)
+    gaming = Category.objects.create(title="Gaming", active=True, parent=laptops)
+    phones = Category.objects.create(title="Phones", active=True)
+    new, hit = Tag.objects.create(name="New"), Tag.objects.create(name="Hit")
+    rows = [
+        (laptops, 1000, 5, True, [new]),
+        (gaming, 2000, 0, False, [new, hit]),
+        (gaming, 1500, 2, True, []),
+        (phones, 500, 1, False, [hit]),
+        (phones, 700, 0, True, [new]),
+        (None, 50, 3, True, []),
+    ]
+    for category, price, count, free, tags in rows:
+        product = Product.objects.create(
+            title="Product",
+            category=category,
+            price=price,
+            count=count,
+            freeDelivery=free,
+            active=True,
+        )
+        product.tags.set(tags)
+    Product.objects.create(title="Hidden", category=phones, price=600)
+    Sale.objects.create(
+        product=Product.objects.get(price=1500),
+        price=1500,
+        salePrice=900,
+        dateFrom=datetime.date.today(),
+    )
+    return {"laptops": laptops, "phones": phones, "new": new, "hit": hit}
+
+
+@override_settings(CATALOG_INDEX_ENABLED=True)
+class CatalogIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.catalog = create_catalog()
+
+    def setUp(self):
+        self.index = get_catalog_index()
+        # индекс общий для процесса, каждый тест начинает с новой сборки
+        self.index.build()
+
+    def filters(self):
+        catalog = self.catalog
+        options = {
+            "category": [None, catalog["laptops"].pk, catalog["phones"].pk],
+            "minPrice": [None, 600],
+            "maxPrice": [None, 1000],
+            "available": [None, True],
+            "freeDelivery": [None, True],
+            "tags": [[], [catalog["new"].pk], [catalog["new"].pk, catalog["hit"].pk]],
+        }
+        for values in itertools.product(*options.values()):
+            yield {key: value for key, value in zip(options, values) if value}
+
+    def sql_ids(self, data):
+        with self.settings(CATALOG_INDEX_ENABLED=False):
+            return sorted(CatalogFilter(data).qs.values_list("pk", flat=True))
+
+    def assertMatchesSql(self, data=None):
+        for data in [data] if data is not None else self.filters():
+            with self.subTest(**data):
+                ids = sorted(CatalogFilter(data).qs.values_list("pk", flat=True))
+                self.assertEqual(ids, self.sql_ids(data))
+
+    def test_filters_match_sql(self):
+        self.assertMatchesSql()
+
+    def test_signals_keep_index_in_sync(self):
+        product = Product.objects.get(price=500)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.category = self.catalog["laptops"]
+            product.count = 0
+            product.save()
+            product.tags.add(self.catalog["new"])
+            Product.objects.create(title="New", price=800, count=1, active=True)
+            Product.objects.filter(title="Hidden").get().delete()
+            Sale.objects.create(
+                product=Product.objects.get(price=2000),
+                price=2000,
+                salePrice=400,
+                dateFrom=datetime.date.today(),
+            )
+        self.assertMatchesSql()
+
+    def test_rollback_leaves_index_unchanged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    product = Product.objects.create(title="X", price=1, active=True)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertNotIn(product.pk, self.index.search())
+
+    def test_changes_during_build_are_kept(self):
+        product = Product.objects.get(price=50)
+        load = self.index.load
+
+        def load_and_change():
+            data = load()
+            # товар изменён, пока собирался снимок базы
+            Product.objects.filter(pk=product.pk).update(price=5)
+            self.index.refresh(product.pk)
+            return data
+
+        with mock.patch.object(self.index, "load", load_and_change):
+            self.index.build()
+        self.assertEqual(self.index.search(maxPrice=10), [product.pk])
+
+
+class CatalogFacetsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.catalog = create_catalog()
+
+    def facets(self, params, index):
+        with self.settings(CATALOG_INDEX_ENABLED=index):
+            if index:
+                get_catalog_index().build()
+            response = self.client.get(reverse("catalog_facets"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get(self, params):
+        # SQL и индекс в памяти должны считать одинаково
+        data = self.facets(params, index=False)
+        self.assertEqual(self.facets(params, index=True), data)
+        tags = {tag["id"]: tag["count"] for tag in data["tags"]}
+        return data, tags
+
+    def test_all_products(self):
+        data, tags = self.get({})
+        self.assertEqual(
+            (data["total"], data["available"], data["freeDelivery"]), (6, 4, 4)
+        )
+        price = data["price"]
+        self.assertEqual((float(price["min"]), float(price["max"])), (50, 2000))
+        self.assertEqual(
+            [bucket["count"] for bucket in price["histogram"]],
+            [1, 0, 1, 1, 2, 0, 0, 0, 0, 1],
+        )
+        self.assertEqual(tags, {self.catalog["new"].pk: 3, self.catalog["hit"].pk: 2})
+
+    def test_category_subtree(self):
+        data, tags = self.get({"category": self.catalog["laptops"].pk})
+        self.assertEqual((data["total"], data["available"]), (3, 2))
+        # цена с распродажей: 1500 -> 900
+        self.assertEqual(float(data["price"]["min"]), 900)
+        self.assertEqual(tags, {self.catalog["new"].pk: 2, self.catalog["hit"].pk: 1})
+
+        data, tags = self.get({"category": self.catalog["phones"].pk})
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(tags, {self.catalog["new"].pk: 1, self.catalog["hit"].pk: 1})
+
+    def test_price_range_and_flags(self):
+        params = {"filter[minPrice]": 600, "filter[maxPrice]": 1000}
+        data, tags = self.get(params)
+        self.assertEqual(data["total"], 3)
+        price = data["price"]
+        self.assertEqual((float(price["min"]), float(price["max"])), (700, 1000))
+        self.assertEqual(tags, {self.catalog["new"].pk: 2})
+
+        data, tags = self.get({**params, "filter[available]": "true"})
+        self.assertEqual((data["total"], data["freeDelivery"]), (2, 2))
+
+    def test_empty(self):
+        data, tags = self.get({"filter[minPrice]": 5000})
+        self.assertEqual(data["total"], 0)
+        self.assertEqual(data["price"]["histogram"], [])
+        self.assertEqual(tags, {})
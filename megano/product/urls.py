@@ -9,10 +9,17 @@ from .views import (
     CategoriesList,
     BannersList,
     Catalog,
+    CatalogFacets,
+    CatalogCacheStats,
+    SearchSuggest,
+    Batch,
 )
 
 urlpatterns = [
     path("catalog/", Catalog.as_view(), name="products_list"),
+    path("catalog/facets/", CatalogFacets.as_view(), name="catalog_facets"),
+    path("catalog/cache/", CatalogCacheStats.as_view(), name="catalog_cache_stats"),
+    path("search/suggest", SearchSuggest.as_view(), name="search_suggest"),
     path("banners/", BannersList.as_view(), name="banners"),
     path("categories/", CategoriesList.as_view(), name="categories"),
     path("products/popular/", PopularList.as_view(), name="popular"),
@@ -21,4 +28,5 @@ urlpatterns = [
     path("product/<int:pk>/", ProductDetail.as_view(), name="product_detail"),
     path("product/<int:pk>/reviews", CreateReview.as_view(), name="add_reviews"),
     path("tags/", TagsList.as_view(), name="tags_list"),
+    path("batch", Batch.as_view(), name="batch"),
 ]
@@ -1,15 +1,30 @@
-from django.db.models import Count
+from django.conf import settings
+from django.db import transaction
 from datetime import datetime
+from django.http import HttpResponse
+from mptt.utils import get_cached_trees
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.generics import GenericAPIView
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import CreateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
 
-from .models import Product, Tag, Sale, Review, Category
+from .models import Product, Tag, Sale, Review, Category, CategoryIcon
+from .models import ProductImage
+from . import cache, popularity
+from .batch import render_batch
+from .conditional import conditional_get, document_etag, document_updated_at
+from .documents import read_document
+from .facets import sql_facets
+from .filters import CatalogFilter, catalog_params
+from .index import get_catalog_index
+from .pagination import CatalogPagination, SalesPagination
+from .suggest import SUGGEST_LIMIT, get_suggest_index
 from .serializers import (
-    ProductSerializer,
+    ProductShortSerializer,
     TagsProductSerializer,
     SaleSerializer,
     ReviewSerializer,
@@ -18,47 +33,104 @@ from .serializers import (
 
 
 class CategoriesList(APIView):
+    @conditional_get("categories", models=[Category, CategoryIcon])
     def get(self, request: Request):
-        categories = Category.objects.filter(parent=None)
-        serialized = CategorySerializer(categories, many=True)
-        return Response(serialized.data)
+        key = cache.get_categories_key()
+        body = cache.get_categories(key)
+        if body is None:
+            serialized = CategorySerializer(active_category_trees(), many=True)
+            body = JSONRenderer().render(serialized.data)
+            cache.set_categories(key, body)
+        return HttpResponse(body, content_type="application/json")
+
+
+def active_category_trees():
+    """
+    Всё дерево активных категорий с иконками одним запросом. Дочерние узлы
+    собираются в памяти; ветки под неактивной категорией скрываются целиком.
+    """
+    categories = Category.objects.filter(active=True).select_related("image")
+    visible, nodes = set(), []
+    for category in categories.order_by("tree_id", "lft"):
+        if category.parent_id is None or category.parent_id in visible:
+            visible.add(category.pk)
+            nodes.append(category)
+    return get_cached_trees(nodes)
 
 
 class ProductDetail(APIView):
     def get(self, request: Request, pk):
-        product = Product.objects.get(pk=pk)
-        serialized = ProductSerializer(product, many=False)
-        return Response(serialized.data)
+        # просмотр учитывается и при ответе 304
+        popularity.record_view(pk)
+        return self.get_document(request, pk)
+
+    @conditional_get(
+        "product_detail",
+        etag_func=document_etag,
+        last_modified_func=document_updated_at,
+    )
+    def get_document(self, request: Request, pk):
+        # готовый JSON из хранилища документов, при промахе - без записи
+        body = read_document(pk)
+        if body is None:
+            raise NotFound()
+        return HttpResponse(body, content_type="application/json")
 
 
 class SalesList(APIView):
+    @conditional_get("sales", models=[Sale, Product, ProductImage])
     def get(self, request: Request):
-        sales = Sale.objects.all()
-        serialized = SaleSerializer(sales, many=True)
-        return Response({"items": serialized.data})
+        # только действующие распродажи: товар и изображения берутся
+        # select_related/prefetch_related по плану SaleSerializer
+        sales = SaleSerializer.setup_queryset(
+            Sale.objects.active().order_by("-dateFrom", "-pk")
+        )
+        paginator = SalesPagination()
+        page = paginator.paginate_queryset(sales, request, view=self)
+        serialized = SaleSerializer(page, many=True)
+        return paginator.get_paginated_response(serialized.data)
 
 
 class LimitedList(APIView):
     def get(self, request: Request):
-        products = Product.objects.filter(limited_edition=True)
-        serialized = ProductSerializer(products, many=True)
+        products = ProductShortSerializer.setup_queryset(
+            Product.objects.filter(limited_edition=True)
+        )
+        serialized = ProductShortSerializer(products, many=True)
         return Response(serialized.data)
 
 
 class PopularList(APIView):
     def get(self, request: Request):
-        products = (
-            Product.objects.filter(active=True)
-            .annotate(count_reviews=Count("reviews"))
-            .order_by("-count_reviews")[:8]
+        # верх рейтинга популярности; пока он не посчитан или в нём мало
+        # товаров (новые товары, просмотры до пересчёта) - добор по числу отзывов
+        limit = popularity.POPULAR_LIMIT
+        ids = popularity.top_product_ids(limit)
+        if len(ids) < limit:
+            others = Product.objects.filter(active=True).exclude(pk__in=ids)
+            others = others.order_by("-reviews_count", "-pk")
+            ids += others.values_list("pk", flat=True)[: limit - len(ids)]
+        products = ProductShortSerializer.setup_queryset(
+            Product.objects.filter(pk__in=ids)
         )
-        serialized = ProductSerializer(products, many=True)
+        products = sorted(products, key=lambda product: ids.index(product.pk))
+        serialized = ProductShortSerializer(products, many=True)
         return Response(serialized.data)
 
 
 class CreateReview(CreateModelMixin, GenericAPIView):
     serializer_class = ReviewSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request: Request, pk):
+        # keyset пагинация от новых к старым по индексу (product, date)
+        if not Product.objects.filter(pk=pk).exists():
+            raise NotFound()
+        reviews = Review.objects.filter(product_id=pk).order_by("-date", "-id")
+        paginator = CatalogPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serialized = ReviewSerializer(page, many=True)
+        return paginator.get_paginated_response(serialized.data)
 
     def post(self, request: Request, pk):
         product = Product.objects.get(id=pk)
@@ -66,23 +138,21 @@ class CreateReview(CreateModelMixin, GenericAPIView):
         request.data["product"] = product.pk
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        Review.objects.create(
-            author=request.data["author"],
-            email=request.data["email"],
-            text=request.data["text"],
-            rate=request.data["rate"],
-            date=datetime.now(),
-            product_id=product.pk,
-        )
-
-        reviews = Review.objects.filter(product_id=product.pk)
-        summa = sum([obj.rate for obj in reviews])
-        product.rating = summa / len(reviews)
-        product.save()
+        # агрегаты отзывов товара обновляются сигналом в той же транзакции
+        with transaction.atomic():
+            Review.objects.create(
+                author=request.data["author"],
+                email=request.data["email"],
+                text=request.data["text"],
+                rate=request.data["rate"],
+                date=datetime.now(),
+                product_id=product.pk,
+            )
         return Response(request.data)
 
 
 class TagsList(APIView):
+    @conditional_get("tags_list", models=[Tag])
     def get(self, request: Request):
         tags = Tag.objects.all()
         data = TagsProductSerializer(tags, many=True)
@@ -90,15 +160,28 @@ class TagsList(APIView):
 
 
 class BannersList(APIView):
+    @conditional_get(
+        "banners", models=[Category, Product, ProductImage, Tag, Sale, Review]
+    )
     def get(self, request: Request):
         favourite_categories = [
             obj.pk for obj in Category.objects.filter(favourite=True)
         ]
-        banners = Product.objects.filter(category_id__in=favourite_categories)
-        serialized = ProductSerializer(banners, many=True)
+        banners = ProductShortSerializer.setup_queryset(
+            Product.objects.filter(category_id__in=favourite_categories)
+        )
+        serialized = ProductShortSerializer(banners, many=True)
         return Response(serialized.data)
 
 
+SORT_FIELDS = {
+    "price": "effective_price",
+    "date": "date",
+    "rating": "rating",
+    "reviews": "reviews_count",
+}
+
+
 def sort_products(request: Request, products):
     sort = request.GET.get("sort")
     sortType = request.GET.get("sortType")
@@ -107,116 +190,91 @@ def sort_products(request: Request, products):
     else:
         sortType = ""
 
-    if sort == "reviews":
-        products = (
-            products.filter(active=True)
-            .annotate(count_reviews=Count("reviews"))
-            .order_by(f"{sortType}count_reviews")
-            .prefetch_related("images", "reviews")
-        )
-    else:
-        products = (
-            products.filter(active=True)
-            .order_by(f"{sortType}{sort}")
-            .prefetch_related("images", "reviews")
-        )
-    return products
+    # при поиске по названию без явной сортировки товары упорядочены по bm25
+    searching = "search_rank" in products.query.annotations
+    field = SORT_FIELDS.get(sort, "search_rank" if searching else "date")
+    # id как второй ключ делает порядок однозначным для keyset пагинации
+    return products.order_by(f"{sortType}{field}", f"{sortType}id")
 
 
 def filter_catalog(request: Request):
-    name = request.query_params.get("filter[name]")
-    min_price = request.query_params.get("filter[minPrice]")
-    max_price = request.query_params.get("filter[maxPrice]")
-    freeDelivery = request.query_params.get("filter[freeDelivery]")
-    available = request.query_params.get("filter[available]")
-
-    tags = request.query_params.getlist("tags[]")
-    category = request.META["HTTP_REFERER"].split("/")[4]
-
-    catalog = Product.objects
-    if category:
-        try:
-            categories = [obj.pk for obj in Category.objects.filter(parent_id=category)]
-            categories.append(int(category))
-            catalog = catalog.filter(category_id__in=categories)
-        except:
-            if str(category).startswith("?filter="):
-                if not name:
-                    name = str(category).split("=")[1]
-            else:
-                category = ""
-
-    if available == "true":
-        if freeDelivery == "true":
-            if tags:
-                catalog = (
-                    catalog.filter(
-                        title__iregex=name,
-                        price__range=(min_price, max_price),
-                        count__gt=0,
-                        freeDelivery=True,
-                        tags__in=tags,
-                    ).prefetch_related("images", "tags")
-                ).distinct()
-            else:
-                catalog = catalog.filter(
-                    title__iregex=name,
-                    price__range=(min_price, max_price),
-                    count__gt=0,
-                    freeDelivery=True,
-                ).prefetch_related("images")
-        elif tags:
-            catalog = (
-                catalog.filter(
-                    title__iregex=name,
-                    price__range=(min_price, max_price),
-                    count__gt=0,
-                    tags__in=tags,
-                )
-                .prefetch_related("images", "tags")
-                .distinct()
-            )
-        else:
-            catalog = catalog.filter(
-                title__iregex=name, price__range=(min_price, max_price), count__gt=0
-            ).prefetch_related("images")
-    elif freeDelivery == "true":
-        if tags:
-            catalog = (
-                catalog.filter(
-                    title__iregex=name,
-                    price__range=(min_price, max_price),
-                    freeDelivery=True,
-                    tags__in=tags,
-                )
-                .prefetch_related("images", "tags")
-                .distinct()
-            )
-        else:
-            catalog = catalog.filter(
-                title__iregex=name,
-                price__range=(min_price, max_price),
-                freeDelivery=True,
-            ).prefetch_related("images")
-    elif tags:
-        catalog = (
-            catalog.filter(
-                title__iregex=name, price__range=(min_price, max_price), tags__in=tags
-            )
-            .prefetch_related("images", "tags")
-            .distinct()
-        )
-    else:
-        catalog = catalog.filter(
-            title__iregex=name, price__range=(min_price, max_price)
-        ).prefetch_related("images")
-
-    return catalog
+    return CatalogFilter(catalog_params(request)).qs
 
 
 class Catalog(APIView):
     def get(self, request: Request):
-        products = filter_catalog(request)
-        products = sort_products(request, products)
-        serialized = ProductSerializer(products, many=True)
-        return Response({"items": serialized.data})
+        filterset = CatalogFilter(catalog_params(request))
+        key = cache.get_cache_key(request, filterset)
+        body = cache.get_page(key)
+        if body is None:
+            products = sort_products(request, filterset.qs)
+            products = ProductShortSerializer.setup_queryset(products)
+            paginator = CatalogPagination()
+            page = paginator.paginate_queryset(products, request, view=self)
+            serialized = ProductShortSerializer(page, many=True)
+            response = paginator.get_paginated_response(serialized.data)
+            body = JSONRenderer().render(response.data)
+            cache.set_page(key, body)
+        return HttpResponse(body, content_type="application/json")
+
+
+class CatalogCacheStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request):
+        return Response(cache.get_stats())
+
+
+class CatalogFacets(APIView):
+    def get(self, request: Request):
+        filterset = CatalogFilter(catalog_params(request))
+        index = get_catalog_index()
+        if index is not None and filterset.is_valid():
+            params = filterset.form.cleaned_data
+            if not params.get("name"):
+                return Response(index.facets(**params))
+        return Response(sql_facets(filterset.qs))
+
+
+SUGGEST_HREFS = {
+    "product": "/product/{pk}",
+    "category": "/catalog/{pk}",
+    "tag": "/catalog/?tags[]={pk}",
+}
+
+
+class SearchSuggest(APIView):
+    def get(self, request: Request):
+        limit = request.GET.get("limit", "")
+        limit = min(int(limit), SUGGEST_LIMIT) if limit.isdigit() else SUGGEST_LIMIT
+        matches = get_suggest_index().suggest(request.GET.get("q", ""), limit)
+        return Response(
+            [
+                {
+                    "type": kind,
+                    "id": pk,
+                    "title": title,
+                    "href": SUGGEST_HREFS[kind].format(pk=pk),
+                }
+                for kind, pk, title in matches
+            ]
+        )
+
+
+class Batch(APIView):
+    def post(self, request: Request):
+        """
+        Несколько GET-запросов к API за один запрос:
+        {"requests": ["/api/banners", "/api/tags/", ...]}
+        """
+        if not isinstance(request.data, dict):
+            raise ValidationError("Expected an object with a list of URLs")
+        urls = request.data.get("requests")
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise ValidationError({"requests": "Expected a list of URLs"})
+        if len(urls) > settings.API_BATCH_MAX_REQUESTS:
+            raise ValidationError(
+                {"requests": f"At most {settings.API_BATCH_MAX_REQUESTS} requests"}
+            )
+        body = render_batch(request._request, urls, request.path)
+        return HttpResponse(body, content_type="application/json")